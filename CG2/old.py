@@ -1,10 +1,32 @@
+import os
+import json
+import queue  # Hands fetched images to the Tk thread
+import hashlib
+import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox
+from concurrent.futures import ThreadPoolExecutor
+from time import time
 import requests
 from PIL import Image, ImageTk
 from io import BytesIO
 import base64  # Import base64 module
 
+IMAGE_WORKERS = 8  # Images fetched at the same time
+IMAGE_TIMEOUT = 10  # Seconds before an image request is given up
+THUMBNAIL_SIZE = (240, 135)  # Largest width and height shown in the list
+THUMBNAIL_CACHE_DIR = "thumbnail_cache"
+THUMBNAIL_CACHE_MAX_BYTES = 50 * 1024 * 1024  # Least recently used thumbnails go past this
+IMAGE_POLL_MS = 50  # How often the Tk thread picks up finished images
+DOWNLOAD_SEGMENTS = 4  # Parallel Range requests per program, if the server allows them
+MIN_SEGMENT_BYTES = 1024 * 1024  # Smaller files are fetched in one request
+DOWNLOAD_BUFFER_SIZE = 1024 * 1024  # Bytes read per call into each segment's reused buffer
+DOWNLOAD_TIMEOUT = 30  # Seconds without data before a download fails
+PROGRESS_POLL_MS = 200  # How often program frames redraw their progress
+
+# One keep-alive session for every image request
+session = requests.Session()
+
 # Encoded URLs (replace with your encoded data)
 programs = [
     {
@@ -32,30 +54,223 @@ def complex_decode(encoded_url):
     
     return decoded_url
 
-# Function to load and display the image from a decoded URL
-def load_image_from_url(url):
+class ThumbnailCache:
+    """Resized thumbnails on disk, keyed by image URL, with the ETag they came with.
+
+    index.json keeps each entry's ETag, size and last use; once the folder
+    grows past max_bytes the least recently used thumbnails are deleted.
+    """
+
+    def __init__(self, folder=THUMBNAIL_CACHE_DIR, max_bytes=THUMBNAIL_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(folder, "index.json")
+        self.lock = threading.Lock()
+        try:
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    def path_for(self, key):
+        return os.path.join(self.folder, key + ".png")
+
+    def get(self, url):
+        """(png bytes, etag) for a cached thumbnail, or (None, None)."""
+        key = hashlib.sha1(url.encode()).hexdigest()
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None, None
+            try:
+                with open(self.path_for(key), "rb") as f:
+                    data = f.read()
+            except OSError:
+                del self.index[key]  # Deleted behind our back
+                return None, None
+            entry["last_used"] = time()
+            return data, entry.get("etag")
+
+    def put(self, url, data, etag):
+        key = hashlib.sha1(url.encode()).hexdigest()
+        with self.lock:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(self.path_for(key), "wb") as f:
+                f.write(data)
+            self.index[key] = {"etag": etag, "size": len(data), "last_used": time()}
+            self.evict()
+            self.save()
+
+    def evict(self):
+        """Drop least recently used thumbnails until the cache fits (lock held)."""
+        total = sum(entry["size"] for entry in self.index.values())
+        for key, entry in sorted(self.index.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+            total -= entry["size"]
+            del self.index[key]
+
+    def flush(self):
+        """Save use order from get() calls, which don't write the index themselves."""
+        with self.lock:
+            self.save()
+
+    def save(self):
+        """Write the index so the next launch knows ETags and use order (lock held)."""
+        if not os.path.isdir(self.folder):
+            return
+        partial_path = self.index_path + ".part"
+        with open(partial_path, "w") as f:
+            json.dump(self.index, f)
+        os.replace(partial_path, self.index_path)
+
+
+thumbnail_cache = ThumbnailCache()
+
+
+# Function to turn a downloaded image into PNG bytes of a thumbnail
+def make_thumbnail(content):
+    img = Image.open(BytesIO(content))
+    if img.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+        img = img.convert("RGBA")  # PNG can't hold CMYK and friends
+    img.thumbnail(THUMBNAIL_SIZE)
+    output = BytesIO()
+    img.save(output, format="PNG")
+    return output.getvalue()
+
+
+# Function to load the image for a decoded URL, from the cache when it is still current
+def load_image_from_url(url, deliver):
+    """Call deliver(png bytes) with the cached thumbnail, then again if the server has a newer one."""
+    cached, etag = thumbnail_cache.get(url)
+    if cached:
+        deliver(cached)  # Show the old copy right away; revalidate below
     try:
-        response = requests.get(url)
+        headers = {"If-None-Match": etag} if cached and etag else {}
+        response = session.get(url, headers=headers, timeout=IMAGE_TIMEOUT)
+        if response.status_code == 304:
+            return
         response.raise_for_status()
-        img_data = BytesIO(response.content)
-        img = Image.open(img_data)
-        return ImageTk.PhotoImage(img)
+        data = make_thumbnail(response.content)
+        thumbnail_cache.put(url, data, response.headers.get("ETag"))
+        if data != cached:
+            deliver(data)
     except Exception as e:
         print(f"Error loading image: {e}")
-        return None
 
-# Function to download the selected program
-def download_program(url, filename):
-    try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        with open(filename, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:
-                    f.write(chunk)
-        messagebox.showinfo("Success", f"{filename} downloaded successfully.")
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to download the file: {e}")
+class ProgramDownload:
+    """Downloads one program on background threads; the Tk thread polls its counters.
+
+    When the server takes Range requests the file is split into up to
+    DOWNLOAD_SEGMENTS parts fetched in parallel, each read into one reused
+    buffer and written at its own offset of a .part file.
+    """
+
+    def __init__(self, url, filename):
+        self.url = url
+        self.filename = filename
+        self.total = 0  # 0 until known (and for servers that don't say)
+        self.done = 0
+        self.error = None
+        self.finished = False
+        self.started = time()
+        self.lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        partial_path = self.filename + ".part"
+        try:
+            ranges = self.plan()
+            with open(partial_path, "wb") as f:
+                f.truncate(self.total)  # Segments write into place
+            if len(ranges) == 1:
+                self.fetch(partial_path, *ranges[0])
+            else:
+                with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+                    for future in [pool.submit(self.fetch, partial_path, start, end) for start, end in ranges]:
+                        future.result()  # Re-raise a segment's error
+            if self.total and self.done != self.total:
+                raise IOError(f"got {self.done} of {self.total} bytes")
+            os.replace(partial_path, self.filename)
+        except Exception as e:
+            self.error = e
+            try:
+                os.remove(partial_path)
+            except OSError:
+                pass
+        finally:
+            self.finished = True
+
+    def plan(self):
+        """Byte ranges to fetch; [(0, None)] means one plain GET."""
+        try:
+            response = session.head(self.url, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+            response.raise_for_status()
+        except requests.RequestException:
+            return [(0, None)]  # Many CDNs and signed URLs refuse HEAD; a plain GET still works
+        self.url = response.url  # Skip the redirects on every segment
+        self.total = int(response.headers.get("Content-Length", 0))
+        if response.headers.get("Accept-Ranges") != "bytes" or self.total < 2 * MIN_SEGMENT_BYTES:
+            if response.headers.get("Content-Encoding"):
+                self.total = 0  # The length is of the compressed body
+            return [(0, None)]
+        count = min(DOWNLOAD_SEGMENTS, self.total // MIN_SEGMENT_BYTES)
+        size = self.total // count
+        return [(i * size, self.total if i == count - 1 else (i + 1) * size) for i in range(count)]
+
+    def fetch(self, path, start, end):
+        """Write bytes [start, end) of the program (the whole body if end is None) at their offset."""
+        headers = {"Range": f"bytes={start}-{end - 1}", "Accept-Encoding": "identity"} if end else {}
+        with session.get(self.url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            if end and response.status_code != 206:
+                raise IOError("server ignored the Range request")
+            response.raw.decode_content = True
+            buffer = memoryview(bytearray(DOWNLOAD_BUFFER_SIZE))
+            with open(path, "r+b") as f:
+                f.seek(start)
+                while True:
+                    received = response.raw.readinto(buffer)
+                    if not received:
+                        break
+                    f.write(buffer[:received])
+                    with self.lock:
+                        self.done += received
+
+    def progress_text(self):
+        mb = 1024 * 1024
+        elapsed = max(time() - self.started, 0.001)
+        size = f"{self.done / mb:.1f} / {self.total / mb:.1f} MB" if self.total else f"{self.done / mb:.1f} MB"
+        return f"{size} at {self.done / mb / elapsed:.2f} MB/s"
+
+
+# Function to download the selected program without blocking the window
+def download_program(url, filename, root, status_label, button):
+    download = ProgramDownload(url, filename)
+    button.config(state="disabled")  # One download per program at a time; others run alongside
+    download.start()
+
+    # Function to redraw this program's progress until its download ends
+    def watch():
+        if not download.finished:
+            status_label.config(text=download.progress_text())
+            root.after(PROGRESS_POLL_MS, watch)
+            return
+        button.config(state="normal")
+        if download.error:
+            status_label.config(text="Failed")
+            messagebox.showerror("Error", f"Failed to download the file: {download.error}")
+        else:
+            status_label.config(text=download.progress_text())
+            messagebox.showinfo("Success", f"{filename} downloaded successfully.")
+
+    watch()
 
 # Function to display the programs with images and download buttons
 def show_programs():
@@ -64,13 +279,41 @@ def show_programs():
     root.geometry("500x600")
     root.resizable(False, False)
 
+    # Images load in the background; each label shows a placeholder until its image arrives
+    placeholder = tk.PhotoImage(width=THUMBNAIL_SIZE[0], height=THUMBNAIL_SIZE[1])
+    placeholder.put("#d9d9d9", to=(0, 0, THUMBNAIL_SIZE[0], THUMBNAIL_SIZE[1]))
+    arrived = queue.Queue()  # (label, png bytes) from the fetch threads
+    image_pool = ThreadPoolExecutor(max_workers=IMAGE_WORKERS)
+
+    # Function to put finished images on their labels (Tk calls only happen on this thread)
+    def show_arrived_images():
+        while True:
+            try:
+                img_label, data = arrived.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                image = ImageTk.PhotoImage(Image.open(BytesIO(data)))
+            except Exception as e:
+                print(f"Error loading image: {e}")
+                continue
+            img_label.config(image=image)
+            img_label.image = image  # Keep a reference
+        root.after(IMAGE_POLL_MS, show_arrived_images)
+
+    def close():
+        image_pool.shutdown(wait=False, cancel_futures=True)
+        thumbnail_cache.flush()
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", close)
+
     # Create a frame for each program
     for program in programs:
         program_name = program["name"]
 
-        # Decode the image URL and load the image
+        # Decode the image URL; the image itself is fetched by image_pool
         decoded_image_url = complex_decode(program["image_url"])
-        image = load_image_from_url(decoded_image_url)
 
         # Decode the download URL
         decoded_download_url = complex_decode(program["download_url"])
@@ -80,19 +323,24 @@ def show_programs():
         frame.pack()
 
         # Program Image
-        if image:
-            img_label = tk.Label(frame, image=image)
-            img_label.image = image  # Keep a reference
-            img_label.pack()
+        img_label = tk.Label(frame, image=placeholder)
+        img_label.pack()
+        image_pool.submit(load_image_from_url, decoded_image_url,
+                          lambda data, img_label=img_label: arrived.put((img_label, data)))
 
         # Program Name
         label = tk.Label(frame, text=program_name, font=("Arial", 14))
         label.pack()
 
-        # Download Button
-        download_button = tk.Button(frame, text="Download", command=lambda u=decoded_download_url: download_program(u, f"{program_name}.py"))
+        # Download Button and its progress/speed line
+        download_button = tk.Button(frame, text="Download")
         download_button.pack(pady=5)
+        status_label = tk.Label(frame, text="", font=("Arial", 9))
+        status_label.pack()
+        download_button.config(command=lambda u=decoded_download_url, n=program_name, s=status_label, b=download_button:
+                               download_program(u, f"{n}.py", root, s, b))
 
+    root.after(IMAGE_POLL_MS, show_arrived_images)
     root.mainloop()
 
 if __name__ == '__main__':
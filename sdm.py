@@ -1,255 +1,2646 @@
+from time import perf_counter
+IMPORT_STARTED = perf_counter()  # For --profile-startup
+
 import os
+import sys
+import argparse
+import importlib
 import threading
-import requests
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-from tkcalendar import Calendar  # Calendar widget for date selection
-from time import sleep, time, strftime
-from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from time import sleep, time, strftime, monotonic
 from datetime import datetime, timedelta
-import pyperclip  # Clipboard handling
 import re  # For URL validation
-import sched  # For scheduling downloads
+import json  # For download state files
+import hashlib  # For checksum verification
+import heapq  # Download queue and scheduled start times
+import itertools
+import random  # Jitter for retry backoff
+import socket
 import logging  # For logging download activities
+import logging.handlers
+import atexit
+import queue  # Hands engine events to the GUI thread and log records to the writer
+import bisect  # Histogram buckets
+from collections import deque
+
+
+class LazyModule:
+    """Stand-in for a module that is only imported when first used.
+
+    Importing requests alone costs more than everything else sdm.py needs to
+    show its window, so slow modules are loaded on the first attribute access.
+    """
+
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, attribute):
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name)
+        return getattr(self.__module, attribute)
+
+
+requests = LazyModule("requests")
+concurrent_futures = LazyModule("concurrent.futures")
+http_client = LazyModule("http.client")
+email_utils = LazyModule("email.utils")
+sqlite3 = LazyModule("sqlite3")
+LAZY_MODULES = ("requests", "concurrent.futures", "http.client", "email.utils", "sqlite3", "tkcalendar", "pyperclip")
+
+# GUI-only dependencies; headless fetch boxes may not have them installed
+try:
+    import tkinter as tk
+    from tkinter import ttk, messagebox, filedialog
+except ImportError:
+    tk = ttk = messagebox = filedialog = None
+
+
+# Function to load an optional module the first time it is needed, or None
+def optional_module(name):
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
 
 # Constants
 CHUNK_SIZE = 1024 * 1024  # 1 MB default
 NUM_THREADS = 8  # Default number of threads
 DEFAULT_RETRY_INTERVAL = 30  # Retry interval in seconds
 DEFAULT_SPEED_LIMIT = 0  # No speed limit by default
-
-# Scheduler
-scheduler = sched.scheduler(time, sleep)
-
-# Initialize logging
-logging.basicConfig(filename='download_manager.log', level=logging.INFO, 
-                    format='%(asctime)s - %(message)s')
+STATE_SUFFIX = ".sdm"  # Sidecar file holding per-segment progress
+STATE_SAVE_INTERVAL = 1  # Seconds between progress saves while downloading
+MIN_SEGMENT_SIZE = 1024 * 1024  # Never split a download into ranges smaller than this
+ENDGAME_MIN_SEGMENT = 128 * 1024  # ...except a slow tail at the end, which is halved down to this
+ENDGAME_SECONDS = 1  # A tail this far from done counts as slow; smaller ones are taken over whole
+POOL_MAX_HOSTS = 32  # Hosts that keep a keep-alive session
+POOL_MAX_SIZE = 16  # Idle keep-alive connections kept per host
+THROTTLE_BURST = 0.1  # Seconds of traffic a rate limiter lets through in one burst
+THROTTLE_SLICE = 0.05  # Read this many seconds' worth of bytes at a time when limited
+THROTTLE_MIN_READ = 16 * 1024  # Smallest read size used while throttling
+SPEED_WINDOW = 5  # Seconds of history used for speed and time left
+PROGRESS_INTERVAL_MS = 100  # GUI refresh period (10 Hz)
+RECEIVE_INTO_BUFFER = True  # Read response bodies into a reused buffer instead of new bytes per chunk
+HOST_PROFILE_PATH = 'host_profiles.json'  # Learned connection count and read size per host
+TUNE_START_CONNECTIONS = 2  # Connections to a host we know nothing about
+TUNE_INTERVAL = 1  # Seconds between throughput measurements
+TUNE_MIN_GAIN = 0.05  # Another connection must add 5% throughput to be kept
+TUNE_READ_SECONDS = 0.1  # Aim for reads that take about this long per connection
+TUNE_MIN_READ = 64 * 1024
+TUNE_MAX_READ = 4 * 1024 * 1024
+TUNE_MAX_THROTTLES = 5  # 429/503 answers in a row before the attempt fails
+VERIFY_BLOCK_SIZE = 4 * 1024 * 1024  # Hashes are kept per block of this size
+VERIFY_POLL_INTERVAL = 0.2  # Seconds between checks for newly committed bytes
+VERIFY_READ_SIZE = 1024 * 1024
+CHECKSUM_LENGTHS = {32: "md5", 40: "sha1", 64: "sha256", 128: "sha512"}  # Hex digits -> algorithm
+MAX_ACTIVE_DOWNLOADS = 3  # Tasks downloading at the same time; the rest wait in the queue
+CONNECTION_BUDGET = 16  # Connections shared by all running tasks
+CONNECT_TIMEOUT = 10  # Seconds to open a connection
+READ_TIMEOUT = 20  # Seconds without a byte before a connection counts as stalled
+SEGMENT_RETRIES = 5  # Failures one segment may have before the task fails
+TASK_SEGMENT_RETRIES = 20  # Segment failures a whole task may have per attempt
+RETRY_BACKOFF_BASE = 1  # Seconds before the first segment retry; doubles each time
+RETRY_BACKOFF_MAX = 60  # Longest wait between segment retries
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+MIRROR_MAX_FAILURES = 3  # Failed requests before a mirror is dropped
+MIRROR_SLOW_RATIO = 0.25  # Drop a mirror whose per-connection speed falls below this share of the best
+MIRROR_JUDGE_SECONDS = 2  # Seconds of use before a mirror can be judged slow
+METRICS_ENABLED = True  # Write the files below whenever a download attempt ends
+METRICS_JSONL_PATH = 'download_metrics.jsonl'  # One JSON line per download attempt
+METRICS_JSONL_MAX_BYTES = 5 * 1024 * 1024  # Rotate to download_metrics.jsonl.1 past this size, like the log
+METRICS_JSONL_BACKUPS = 3  # Rotated files kept
+METRICS_PROM_PATH = 'download_metrics.prom'  # Prometheus text format, rewritten each time
+METRICS_PROM_INTERVAL = 1  # Rewrite download_metrics.prom at most this often (and on exit)
+METRICS_RECENT_ATTEMPTS = 500  # Finished attempts kept whole for the Statistics window
+STALL_SECONDS = 2  # A read that waits longer than this counts as a stall
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+THROUGHPUT_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 200)  # MB/s per request
+FAST_START = True  # New downloads skip the HEAD and learn the size from their first GET
+FIRST_RANGE_SIZE = MIN_SEGMENT_SIZE  # Bytes asked for by that GET; smaller files need no other request
+PROBE_WORKERS = 16  # Concurrent HEAD requests while importing a URL list
+PROBE_MAX_AGE = 600  # Seconds an import probe is trusted instead of a new HEAD
+TASK_DB_PATH = 'downloads.db'  # Tasks and host settings kept between runs (GUI)
+STORE_FLUSH_INTERVAL = 1  # Seconds between batched writes to the task database
+FINISHED_STATUSES = ("Completed", "Error")  # Stored tasks that are history, not queue
+HISTORY_PAGE_ROWS = 2000  # Finished tasks added to the task list per GUI tick at startup
+RESTORE_PAGE_ROWS = 500  # Unfinished tasks recreated per GUI tick at startup
+LOG_PATH = 'download_manager.log'
+LOG_MAX_BYTES = 5 * 1024 * 1024  # Rotate to download_manager.log.1 past this size
+LOG_BACKUPS = 3  # Rotated files kept
+LOG_PAGE_BYTES = 64 * 1024  # The log viewer reads the file this much at a time
+LOG_PAGE_LINES = 500  # Lines loaded per "older" step
+LOG_SCAN_BYTES = 8 * 1024 * 1024  # Most bytes one step reads while looking for filter matches
+LOG_VIEW_MAX_LINES = 20000  # Lines kept in the viewer; the far end is dropped past this
+LOG_POLL_MS = 1000  # How often the viewer looks for new lines
+
+# Initialize logging: callers only put records on a queue, a listener thread writes the file
+log_file_handler = logging.handlers.RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES,
+                                                        backupCount=LOG_BACKUPS, encoding="utf-8", delay=True)
+log_file_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, log_file_handler)
+log_listener.start()
+atexit.register(log_listener.stop)  # Flush what is still queued
+# The queue handler only renders the message; the file handler adds the time
+logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[logging.handlers.QueueHandler(log_queue)])
 
 # Bandwidth usage
 current_bandwidth = 0  # Bandwidth usage in MB/s
 
+# Compiled once; imports validate thousands of lines with it
+URL_PATTERN = re.compile(
+    r'^(http|https)://'  # http:// or https://
+    r'(([A-Za-z0-9.-]+)(\.[A-Za-z]{2,})'  # domain name and top-level domain
+    r'|localhost|\d{1,3}(\.\d{1,3}){3})'  # or a local/IPv4 host (mirrors, benchmarks)
+    r'(:\d+)?(/.*)?$'  # optional port and path
+)
+
 # Validate the URL
 def is_valid_url(url):
-    regex = re.compile(
-        r'^(http|https)://'  # http:// or https://
-        r'([A-Za-z0-9.-]+)'  # domain name
-        r'(\.[A-Za-z]{2,})'  # top-level domain
-        r'(:\d+)?(/.*)?$'  # optional port and path
-    )
-    return re.match(regex, url) is not None
+    return URL_PATTERN.match(url) is not None
+
+# Split pasted or imported text into URLs (one per line, no duplicates) and rejected lines
+def read_url_list(text):
+    urls, rejected, seen = [], [], set()
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue  # Blank lines and comments
+        if not is_valid_url(line):
+            rejected.append(line)
+        elif line not in seen:
+            seen.add(line)
+            urls.append(line)
+    return urls, rejected
+
+###############################################################################
+# Download engine (no GUI code below this line until the GUI section)
+###############################################################################
+
+# Set by the timed connection classes on the thread that opened the connection
+connect_timer = threading.local()
+timed_pools = {}  # scheme -> urllib3 pool class whose connections time connect()
+
+
+def timed_pool_classes():
+    """urllib3 pool classes that record how long each new connection took to open."""
+    if not timed_pools:
+        urllib3_pools = importlib.import_module("urllib3.connectionpool")
+
+        def timed(connection_class):
+            class TimedConnection(connection_class):
+                def connect(self):
+                    started = perf_counter()
+                    super().connect()
+                    connect_timer.seconds = perf_counter() - started
+            return TimedConnection
+
+        for scheme, pool_class in (("http", urllib3_pools.HTTPConnectionPool),
+                                   ("https", urllib3_pools.HTTPSConnectionPool)):
+            timed_pools[scheme] = type("Timed" + pool_class.__name__, (pool_class,),
+                                       {"ConnectionCls": timed(pool_class.ConnectionCls)})
+    return timed_pools
+
+
+class SessionPool:
+    """Keep-alive requests.Session per host, shared by every task and segment.
+
+    Reusing sessions saves a TCP (and TLS) handshake on every segment and on
+    every small file fetched from the same host.
+    """
+
+    def __init__(self, max_hosts=POOL_MAX_HOSTS, max_size=POOL_MAX_SIZE):
+        self.max_hosts = max_hosts
+        self.max_size = max_size
+        self.sessions = {}  # "scheme://host:port" -> Session, least recently used first
+        self.lock = threading.Lock()
+
+    def session_for(self, url):
+        """Return the shared session for url's host, creating it if needed."""
+        parts = urlsplit(url)
+        key = f"{parts.scheme}://{parts.netloc}"
+        with self.lock:
+            session = self.sessions.pop(key, None)
+            if session is None:
+                session = requests.Session()
+                # Look up proxies, CA bundle and .netrc once per host instead of scanning
+                # the environment on every request, which cost more than a local HEAD
+                session.trust_env = False
+                session.proxies = requests.utils.get_environ_proxies(url)
+                session.auth = requests.utils.get_netrc_auth(url)
+                session.verify = os.environ.get("REQUESTS_CA_BUNDLE") or os.environ.get("CURL_CA_BUNDLE") or True
+                # pool_block=False: extra threads still get a connection, it just isn't kept
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_size)
+                adapter.poolmanager.pool_classes_by_scheme = timed_pool_classes()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                if len(self.sessions) >= self.max_hosts:
+                    oldest = next(iter(self.sessions))
+                    self.sessions.pop(oldest).close()
+            self.sessions[key] = session
+            return session
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+        return self.session_for(url).get(url, **kwargs)
+
+    def head(self, url, **kwargs):
+        kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+        return self.session_for(url).head(url, **kwargs)
+
+    def stats(self):
+        """Requests, new connections and reused connections per host."""
+        result = {}
+        with self.lock:
+            sessions = list(self.sessions.items())
+        for key, session in sessions:
+            requests_made = connections = 0
+            for adapter in set(session.adapters.values()):
+                for pool_key in adapter.poolmanager.pools.keys():
+                    pool = adapter.poolmanager.pools.get(pool_key)
+                    if pool is not None:
+                        requests_made += pool.num_requests
+                        connections += pool.num_connections
+            result[key] = {
+                "requests": requests_made,
+                "connections": connections,
+                "reused": max(0, requests_made - connections),
+            }
+        return result
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+
+
+# Shared by every task unless one is given its own pool
+http_pool = SessionPool()
+
+
+def probe_url(pool, url):
+    """HEAD url and return its size, validators and whether it serves byte ranges."""
+    response = pool.head(url)
+    return {
+        "size": int(response.headers.get('content-length', 0)),
+        "etag": response.headers.get('ETag'),
+        "last_modified": response.headers.get('Last-Modified'),
+        "ranges": response.headers.get('Accept-Ranges', '').lower() == 'bytes',
+        "time": time(),
+    }
+
+
+def probe_urls(pool, urls, workers=PROBE_WORKERS):
+    """Yield (url, probe_url() result or exception) as answers arrive.
+
+    A fixed set of `workers` threads shares the pool's keep-alive
+    connections, and only a few requests per worker are queued at once, so
+    probing ten thousand URLs needs neither ten thousand threads nor futures.
+    """
+    def probe(url):
+        try:
+            return url, probe_url(pool, url)
+        except (requests.RequestException, ValueError) as e:
+            return url, e
+
+    with concurrent_futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="probe") as executor:
+        pending = set()
+        for url in urls:
+            pending.add(executor.submit(probe, url))
+            if len(pending) >= workers * 2:
+                done, pending = concurrent_futures.wait(pending, return_when=concurrent_futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in concurrent_futures.as_completed(pending):
+            yield future.result()
+
+
+class TokenBucket:
+    """Limits a byte rate; rate 0 means unlimited. The rate can change at any time.
+
+    Readers take tokens after each read and may go into debt, then wait on a
+    condition until the debt is paid back, so the long-run rate is exact even
+    with large reads and there is no polling loop.
+    """
+
+    def __init__(self, rate=0):
+        self.rate = rate  # Bytes per second
+        self.tokens = 0
+        self.updated = monotonic()
+        self.condition = threading.Condition()
+
+    def refill(self, now):
+        capacity = self.rate * THROTTLE_BURST
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, rate):
+        """Change the rate; waiting readers pick it up immediately."""
+        with self.condition:
+            self.refill(monotonic())
+            self.rate = max(0, rate)
+            self.condition.notify_all()
+
+    def consume(self, amount, should_stop=None):
+        """Account for amount bytes, blocking until the rate allows them."""
+        if self.rate <= 0:
+            return  # Unlimited: no locking on the hot path
+        with self.condition:
+            self.refill(monotonic())
+            self.tokens -= amount
+            while self.rate > 0 and self.tokens < 0:
+                if should_stop and should_stop():
+                    return
+                # Wake up early now and then so pause/cancel are noticed
+                self.condition.wait(min(-self.tokens / self.rate, 0.25))
+                self.refill(monotonic())
+
+    def read_size(self, default):
+        """A read size that keeps bursts short under the current rate."""
+        if self.rate <= 0:
+            return default
+        return int(min(default, max(THROTTLE_MIN_READ, self.rate * THROTTLE_SLICE)))
+
+
+# Shared by every task; Settings > Speed Limit changes its rate
+bandwidth_limiter = TokenBucket(DEFAULT_SPEED_LIMIT * 1024 * 1024)
+
+
+class ConnectionBudget:
+    """Caps the connections all running tasks may have open at once.
+
+    Each running task may hold at most an equal share of the budget, so one
+    task with many connections can't starve the others.
+    """
+
+    def __init__(self, limit=CONNECTION_BUDGET):
+        self.limit = limit
+        self.used = 0
+        self.active_tasks = 0  # Kept up to date by DownloadQueue
+        self.lock = threading.Lock()
+
+    def acquire(self, wanted, held):
+        """Grant up to `wanted` more connections to a task that holds `held`."""
+        with self.lock:
+            share = max(1, self.limit // max(1, self.active_tasks))
+            granted = max(0, min(wanted, share - held, self.limit - self.used))
+            self.used += granted
+            return granted
+
+    def release(self, count=1):
+        with self.lock:
+            self.used = max(0, self.used - count)
+
+
+def set_global_speed_limit(mb_per_second):
+    """Limit the combined speed of all downloads (0 = unlimited)."""
+    global DEFAULT_SPEED_LIMIT
+    DEFAULT_SPEED_LIMIT = mb_per_second
+    bandwidth_limiter.set_rate(mb_per_second * 1024 * 1024)
+    logging.info(f"Speed limit set to {mb_per_second} MB/s")
+
+class PositionalFile:
+    """Destination file that each segment writes at its own offset with os.pwrite.
+
+    There is no shared file position, so concurrent segments never race on
+    seek(), and the file is preallocated so writes don't keep growing it.
+    """
+
+    def __init__(self, path, size, truncate):
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        if truncate:
+            flags |= os.O_TRUNC
+        self.fd = os.open(path, flags, 0o644)
+        self.closed = False
+        self.seek_lock = threading.Lock()  # Only used where os.pwrite is missing (Windows)
+        if size:
+            self.preallocate(size)
+
+    def preallocate(self, size):
+        if os.fstat(self.fd).st_size >= size:
+            return
+        try:
+            os.posix_fallocate(self.fd, 0, size)  # Reserves the blocks up front
+        except (AttributeError, OSError):
+            os.ftruncate(self.fd, size)  # Not supported here: at least set the size
+
+    def write_at(self, data, offset):
+        """Write all of data (bytes or memoryview) at offset."""
+        view = memoryview(data)
+        if hasattr(os, "pwrite"):
+            while view:
+                written = os.pwrite(self.fd, view, offset)
+                view = view[written:]
+                offset += written
+        else:
+            with self.seek_lock:
+                os.lseek(self.fd, offset, os.SEEK_SET)
+                while view:
+                    view = view[os.write(self.fd, view):]
+
+    def read_at(self, length, offset):
+        if hasattr(os, "pread"):
+            return os.pread(self.fd, length, offset)
+        with self.seek_lock:
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            return os.read(self.fd, length)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            os.close(self.fd)
+
+
+def iter_body(response, read_size):
+    """Yield a response body in pieces of up to read_size bytes.
+
+    With RECEIVE_INTO_BUFFER the socket is read straight into one reused
+    bytearray and memoryviews of it are yielded, so there is no allocation per
+    chunk. Each piece is only valid until the next one is requested.
+    """
+    raw = getattr(response.raw, "_fp", None)  # The http.client response under urllib3
+    encoding = response.headers.get("Content-Encoding", "identity")
+    if not RECEIVE_INTO_BUFFER or encoding != "identity" or not hasattr(raw, "readinto"):
+        yield from response.iter_content(read_size)
+        return
+    buffer = memoryview(bytearray(read_size))
+    while True:
+        received = raw.readinto(buffer)
+        if not received:
+            return
+        yield buffer[:received]
+
+
+def interrupt_response(response):
+    """Wake a thread blocked reading response by shutting its socket down."""
+    connection = getattr(response.raw, "_connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # Already closed
+
+
+# Errors a fresh connection may cure; anything else fails the task
+def retryable_errors():
+    return (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+            http_client.HTTPException, socket.timeout, ConnectionError)
+
+
+def backoff_seconds(failures):
+    """Exponential backoff with full jitter for the given failure count."""
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (failures - 1)))
+
+
+def retry_after_seconds(response, default=DEFAULT_RETRY_INTERVAL):
+    """Seconds to wait according to a response's Retry-After header."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return default
+    try:
+        return max(0, int(value))
+    except ValueError:
+        pass
+    try:
+        when = email_utils.parsedate_to_datetime(value)
+        return max(0, (when - datetime.now(tz=when.tzinfo)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+
+class HostProfiles:
+    """Learned connection count and read size per host.
+
+    Kept in a small JSON file, or in the task database once a TaskStore is
+    attached (profiles from the JSON file are carried over on first use).
+    """
+
+    def __init__(self, path=HOST_PROFILE_PATH):
+        self.path = path
+        self.store = None  # TaskStore to keep the profiles in instead of the file
+        self.profiles = None  # Loaded on first use
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.profiles is None:
+            try:
+                with open(self.path, 'r') as profile_file:
+                    self.profiles = json.load(profile_file)
+            except (OSError, ValueError):
+                self.profiles = {}
+            if self.store:
+                stored = self.store.load_hosts()
+                for host, profile in self.profiles.items():
+                    if host not in stored:
+                        self.store.save_host(host, profile)  # Carried over from the JSON file
+                self.profiles.update(stored)
+        return self.profiles
+
+    def get(self, host):
+        with self.lock:
+            return dict(self.load().get(host, {}))
+
+    def update(self, host, **settings):
+        with self.lock:
+            profile = self.load().setdefault(host, {})
+            profile.update(settings, updated=time())
+            if self.store:
+                self.store.save_host(host, profile)
+                return
+            temp_path = self.path + ".tmp"
+            try:
+                with open(temp_path, 'w') as profile_file:
+                    json.dump(self.profiles, profile_file, indent=1)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                logging.error(f"Could not save host profile for {host}: {e}")
+
+
+host_profiles = HostProfiles()
+
+
+class ConnectionTuner:
+    """Hill-climbs the number of connections to one host and picks a read size.
+
+    Starts from the host's saved profile (or TUNE_START_CONNECTIONS), adds a
+    connection while total throughput keeps rising by TUNE_MIN_GAIN, steps
+    back and settles once it stops rising, and halves on 429/503 answers.
+    """
+
+    def __init__(self, url, max_connections, profiles=None):
+        self.host = urlsplit(url).netloc
+        self.profiles = profiles or host_profiles
+        profile = self.profiles.get(self.host)
+        self.max_connections = max(1, max_connections)
+        self.connections = max(1, min(self.max_connections, profile.get("connections", TUNE_START_CONNECTIONS)))
+        self.read_size = profile.get("read_size", CHUNK_SIZE)
+        self.best_rate = 0
+        self.settled = False
+        self.resume_at = 0  # Don't add connections before this time (Retry-After)
+        self.throttle_count = 0
+
+    def observe(self, rate, workers):
+        """Feed the total bytes/second measured with `workers` connections."""
+        if rate <= 0 or workers < self.connections:
+            return  # Still ramping up, or nothing to measure
+        self.throttle_count = 0
+        per_connection = rate / workers * TUNE_READ_SECONDS
+        read_size = min(TUNE_MAX_READ, max(TUNE_MIN_READ, int(per_connection)))
+        self.read_size = 1 << (read_size.bit_length() - 1)  # Round down to a power of two
+        if self.settled:
+            return
+        if rate > self.best_rate * (1 + TUNE_MIN_GAIN):
+            self.best_rate = rate
+            if self.connections < self.max_connections:
+                self.connections += 1
+                logging.info(f"Tuning {self.host}: trying {self.connections} connections")
+            else:
+                self.settled = True
+        else:
+            self.connections = max(1, self.connections - 1)  # The last one didn't help
+            self.settled = True
+            logging.info(f"Tuning {self.host}: settled on {self.connections} connections")
+
+    def throttled(self, retry_after):
+        """The server answered 429/503: halve the connections and wait."""
+        self.connections = max(1, self.connections // 2)
+        self.settled = True
+        self.resume_at = time() + retry_after
+        self.throttle_count += 1
+        logging.info(f"Tuning {self.host}: throttled, backing off to {self.connections} connections")
+
+    def save(self):
+        self.profiles.update(self.host, connections=self.connections, read_size=self.read_size)
+
+
+class ChecksumMismatchError(Exception):
+    """The finished file does not match the expected digest."""
+
+
+def parse_checksum(text, algorithm=None):
+    """Turn "sha256:<hex>", "<hex>" or a .sha256/.md5 file's contents into (algorithm, hex)."""
+    text = text.strip()
+    if ":" in text.split()[0]:
+        algorithm, text = text.split(":", 1)
+    digest = text.split()[0].lower()  # "<hex>  filename" as written by sha256sum
+    algorithm = (algorithm or CHECKSUM_LENGTHS.get(len(digest), "")).lower()
+    if algorithm not in hashlib.algorithms_available or not re.fullmatch(r"[0-9a-f]+", digest):
+        raise ValueError(f"Unrecognised checksum: {text[:80]}")
+    return algorithm, digest
+
+
+def load_block_checksums(path):
+    """Read a block digest file: {"algorithm": ..., "block_size": ..., "hashes": [hex, ...]}."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    try:
+        block_checksums = {"algorithm": str(data["algorithm"]).lower(), "block_size": int(data["block_size"]),
+                           "hashes": [str(digest).lower() for digest in data["hashes"]]}
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Not a block digest file: {path} ({e})")
+    if block_checksums["algorithm"] not in hashlib.algorithms_available or block_checksums["block_size"] <= 0:
+        raise ValueError(f"Unusable block digest file: {path}")
+    return block_checksums
+
+
+class StreamVerifier:
+    """Hashes a download in file order on its own thread while it downloads.
+
+    Whenever the committed prefix of the file grows past a block, the block is
+    read back (from the page cache, just after it was written) and fed to both
+    the whole-file digest and that block's digest. Network threads do no
+    hashing. With expected block digests, bad blocks are found as they stream
+    by and can be re-fetched on their own.
+    """
+
+    def __init__(self, task, algorithm=None, expected=None, block_checksums=None):
+        self.task = task
+        self.algorithm = algorithm
+        self.expected = expected
+        self.block_size = VERIFY_BLOCK_SIZE
+        self.block_algorithm = None
+        self.expected_blocks = None
+        if block_checksums:
+            self.block_size = int(block_checksums["block_size"])
+            self.block_algorithm = block_checksums["algorithm"]
+            self.expected_blocks = [digest.lower() for digest in block_checksums["hashes"]]
+        self.file_digest = hashlib.new(algorithm) if algorithm else None
+        self.block_hashes = []  # Hex digest of every block hashed so far, in order
+        self.bad_blocks = []  # Indexes of blocks that don't match expected_blocks
+        self.frontier = 0  # Bytes hashed so far
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                self.hash_ready_blocks()
+                if self.frontier >= self.task.total_size:
+                    return
+                self.stopped.wait(VERIFY_POLL_INTERVAL)
+        except (OSError, ValueError) as e:
+            logging.error(f"Verifier stopped for {self.task.filename}: {e}")
+
+    def hash_ready_blocks(self):
+        total = self.task.total_size
+        committed = self.task.committed_prefix()
+        while not self.stopped.is_set() and self.frontier < total:
+            end = min(self.frontier + self.block_size, total)
+            if end > committed:
+                return
+            self.hash_block(len(self.block_hashes), self.frontier, end, feed_file=True)
+            self.frontier = end
+
+    def hash_block(self, index, start, end, feed_file):
+        block_digest = hashlib.new(self.block_algorithm or self.algorithm or "sha256")
+        offset = start
+        while offset < end:
+            data = self.task.file_handle.read_at(min(VERIFY_READ_SIZE, end - offset), offset)
+            if not data:
+                raise ValueError(f"short read at byte {offset}")
+            block_digest.update(data)
+            if feed_file and self.file_digest:
+                self.file_digest.update(data)
+            offset += len(data)
+        digest = block_digest.hexdigest()
+        if index == len(self.block_hashes):
+            self.block_hashes.append(digest)
+        else:
+            self.block_hashes[index] = digest
+        if self.expected_blocks and index < len(self.expected_blocks) and digest != self.expected_blocks[index]:
+            if index not in self.bad_blocks:
+                self.bad_blocks.append(index)
+            logging.error(f"Block {index} of {self.task.filename} failed verification")
+        return digest
+
+    def finish(self):
+        """Wait until every byte is hashed; call once the download is complete."""
+        self.thread.join()
+        if self.frontier < self.task.total_size:
+            self.hash_ready_blocks()  # The thread stopped early (e.g. after a read error)
+
+    def check_block(self, index):
+        """Re-hash one block after it was re-fetched; True if it now matches."""
+        start = index * self.block_size
+        end = min(start + self.block_size, self.task.total_size)
+        if self.hash_block(index, start, end, feed_file=False) == self.expected_blocks[index]:
+            self.bad_blocks.remove(index)
+            return True
+        return False
+
+    def rehash_file(self):
+        """Recompute the whole-file digest after blocks were repaired."""
+        self.file_digest = hashlib.new(self.algorithm)
+        offset = 0
+        while offset < self.task.total_size:
+            data = self.task.file_handle.read_at(VERIFY_READ_SIZE, offset)
+            if not data:
+                break
+            self.file_digest.update(data)
+            offset += len(data)
+
+    def matches(self):
+        return self.file_digest is None or self.file_digest.hexdigest() == self.expected
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+class Histogram:
+    """Counts of observations per bucket, Prometheus style (upper bounds, plus +Inf)."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation (None if empty)."""
+        if not self.count:
+            return None
+        seen = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return bound
+        return float("inf")
+
+    def to_dict(self):
+        return {"bounds": list(self.bounds), "counts": self.counts, "sum": round(self.sum, 6), "count": self.count}
+
+
+class TaskMetrics:
+    """What one download attempt spent its time on.
+
+    Workers call the record_* methods; each costs a lock and a few additions,
+    so metrics stay on for every download.
+    """
+
+    def __init__(self, task, attempt):
+        self.filename = task.filename
+        self.url = task.url
+        self.attempt = attempt
+        self.started = time()
+        self.finished = None
+        self.outcome = None
+        self.ttfb = None  # Seconds from start() to the first body byte of the attempt
+        self.bytes = 0
+        self.requests = 0
+        self.retries = 0
+        self.stalls = 0
+        self.connect = Histogram(SECONDS_BUCKETS)  # New connections only
+        self.request_ttfb = Histogram(SECONDS_BUCKETS)  # Request sent -> response headers
+        self.throughput = Histogram(THROUGHPUT_BUCKETS)  # MB/s of each finished request
+        self.write_latency = Histogram(SECONDS_BUCKETS)
+        self.segments = []  # One record per segment request
+        self.lock = threading.Lock()
+
+    def begin_request(self, start, end, url):
+        connect_timer.seconds = None
+        return {"start": start, "end": end, "url": url, "connect": None, "ttfb": None,
+                "bytes": 0, "seconds": None, "stalls": 0, "error": None, "began": perf_counter()}
+
+    def record_headers(self, record, elapsed):
+        record["ttfb"] = elapsed
+        record["connect"] = getattr(connect_timer, "seconds", None)
+        with self.lock:
+            self.requests += 1
+            self.request_ttfb.observe(elapsed)
+            if record["connect"] is not None:
+                self.connect.observe(record["connect"])
+
+    def record_read(self, record, size, waited, write_seconds):
+        record["bytes"] += size
+        stalled = waited > STALL_SECONDS
+        if stalled:
+            record["stalls"] += 1
+        with self.lock:
+            if self.ttfb is None:
+                self.ttfb = time() - self.started
+            self.bytes += size
+            self.stalls += stalled
+            self.write_latency.observe(write_seconds)
+
+    def end_request(self, record, error=None):
+        record["seconds"] = perf_counter() - record.pop("began")
+        if error is not None:
+            record["error"] = type(error).__name__
+        with self.lock:
+            if isinstance(error, (socket.timeout, requests.Timeout)):
+                self.stalls += 1  # The read timeout gave up on a silent connection
+            if record["bytes"] and record["seconds"] > 0:
+                self.throughput.observe(record["bytes"] / record["seconds"] / 1024 / 1024)
+            self.segments.append(record)
+
+    def record_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    def finish(self, outcome):
+        self.finished = time()
+        self.outcome = outcome
+
+    def to_dict(self):
+        with self.lock:
+            elapsed = (self.finished or time()) - self.started
+            return {
+                "file": self.filename, "url": self.url, "attempt": self.attempt, "outcome": self.outcome,
+                "started": round(self.started, 3), "seconds": round(elapsed, 3),
+                "ttfb": self.ttfb and round(self.ttfb, 4), "bytes": self.bytes,
+                "mb_per_s": round(self.bytes / elapsed / 1024 / 1024, 3) if elapsed > 0 else None,
+                "requests": self.requests, "retries": self.retries, "stalls": self.stalls,
+                "connect": self.connect.to_dict(), "request_ttfb": self.request_ttfb.to_dict(),
+                "throughput": self.throughput.to_dict(), "write_latency": self.write_latency.to_dict(),
+                "segments": [{key: round(value, 4) if isinstance(value, float) else value
+                              for key, value in record.items()} for record in list(self.segments)],
+            }
+
+
+def empty_totals():
+    return {"bytes": 0, "requests": 0, "retries": 0, "stalls": 0, "attempts": 0,
+            "connect": Histogram(SECONDS_BUCKETS), "request_ttfb": Histogram(SECONDS_BUCKETS),
+            "throughput": Histogram(THROUGHPUT_BUCKETS), "write_latency": Histogram(SECONDS_BUCKETS)}
+
+
+def add_to_totals(totals, metrics):
+    """Add one attempt's counters and histograms (or another totals dict) into totals."""
+    get = metrics.get if isinstance(metrics, dict) else lambda name: getattr(metrics, name)
+    totals["attempts"] += get("attempts") if isinstance(metrics, dict) else 1
+    for name in ("bytes", "requests", "retries", "stalls"):
+        totals[name] += get(name)
+    for name in ("connect", "request_ttfb", "throughput", "write_latency"):
+        totals[name].merge(get(name))
+
+
+class MetricsRegistry:
+    """Running totals of every attempt, plus the recent ones, exported as JSON lines and Prometheus text.
+
+    A finished attempt is added into the totals once, so exporting costs the
+    same after ten attempts or ten thousand; only running attempts and the
+    last METRICS_RECENT_ATTEMPTS finished ones are kept whole. The JSON-lines
+    file is rotated like the log, so a long-running queue doesn't grow it forever.
+    """
+
+    def __init__(self, jsonl_path=METRICS_JSONL_PATH, prom_path=METRICS_PROM_PATH):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self.enabled = METRICS_ENABLED
+        self.finished_totals = empty_totals()  # Every finished attempt
+        self.running = set()  # TaskMetrics of attempts still going
+        self.recent = deque(maxlen=METRICS_RECENT_ATTEMPTS)  # Finished TaskMetrics, oldest first
+        self.prom_written = 0  # When the Prometheus file was last rewritten
+        self.prom_stale = False  # Attempts ended since then
+        self.lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def begin(self, task, attempt):
+        metrics = TaskMetrics(task, attempt)
+        with self.lock:
+            self.running.add(metrics)
+        return metrics
+
+    def end(self, metrics, outcome):
+        """Close an attempt, add it to the totals and export it."""
+        metrics.finish(outcome)
+        with self.lock:
+            self.running.discard(metrics)
+            self.recent.append(metrics)
+            with metrics.lock:
+                add_to_totals(self.finished_totals, metrics)
+        if not self.enabled:
+            return
+        try:
+            line = json.dumps(metrics.to_dict()) + "\n"
+            with self.lock:
+                with open(self.jsonl_path, "a") as f:
+                    f.write(line)
+                    full = f.tell() >= METRICS_JSONL_MAX_BYTES
+                if full:
+                    self.rotate_jsonl()
+                self.prom_stale = True
+                if time() - self.prom_written >= METRICS_PROM_INTERVAL:
+                    self.write_prometheus()
+        except OSError as e:
+            logging.error(f"Could not write metrics: {e}")
+
+    def rotate_jsonl(self):
+        """Shift the JSON lines to .1, .2, ... and drop the oldest, like the log's backups (lock held)."""
+        for index in range(METRICS_JSONL_BACKUPS - 1, 0, -1):
+            older = f"{self.jsonl_path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.jsonl_path}.{index + 1}")
+        os.replace(self.jsonl_path, self.jsonl_path + ".1")
+
+    def flush(self):
+        """Rewrite the Prometheus file if attempts ended since it was last written."""
+        try:
+            with self.lock:
+                if self.enabled and self.prom_stale:
+                    self.write_prometheus()
+        except OSError as e:
+            logging.error(f"Could not write metrics: {e}")
+
+    def attempts(self):
+        """Running and recent attempts, newest first."""
+        with self.lock:
+            return sorted(self.running, key=lambda m: m.started, reverse=True) + list(reversed(self.recent))
+
+    def totals(self):
+        """Counters and merged histograms over all attempts, running ones included."""
+        totals = empty_totals()
+        with self.lock:
+            add_to_totals(totals, self.finished_totals)
+            running = list(self.running)
+        for metrics in running:
+            with metrics.lock:
+                add_to_totals(totals, metrics)
+        return totals
+
+    def write_prometheus(self):
+        """Rewrite the text file for a node_exporter textfile collector (lock held)."""
+        totals = empty_totals()
+        add_to_totals(totals, self.finished_totals)
+        for metrics in list(self.running):
+            with metrics.lock:
+                add_to_totals(totals, metrics)
+        lines = []
+        for name, help_text in (("bytes", "Bytes downloaded"), ("requests", "HTTP requests for segments"),
+                                ("retries", "Segment retries"), ("stalls", "Reads slower than the stall threshold"),
+                                ("attempts", "Download attempts")):
+            lines += [f"# HELP sdm_{name}_total {help_text}", f"# TYPE sdm_{name}_total counter",
+                      f"sdm_{name}_total {totals[name]}"]
+        for name, metric, help_text in (("connect", "sdm_connect_seconds", "Time to open a connection"),
+                                        ("request_ttfb", "sdm_request_ttfb_seconds", "Request sent to headers received"),
+                                        ("throughput", "sdm_request_throughput_mb_per_second", "Throughput of each request"),
+                                        ("write_latency", "sdm_disk_write_seconds", "Time per positional write")):
+            histogram = totals[name]
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+            cumulative = 0
+            for bound, count in zip(histogram.bounds + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines += [f"{metric}_sum {histogram.sum:.6f}", f"{metric}_count {histogram.count}"]
+        partial_path = self.prom_path + ".part"
+        with open(partial_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(partial_path, self.prom_path)  # Scrapers never see half a file
+        self.prom_written = time()
+        self.prom_stale = False
+
+
+metrics_registry = MetricsRegistry()
+
+
+class ResourceChangedError(Exception):
+    """The remote file no longer matches the partial download on disk."""
+
+
+class Mirror:
+    """One URL a task can fetch its bytes from, and how well it is doing."""
+
+    def __init__(self, url):
+        self.url = url
+        self.validator = None  # Its own ETag or Last-Modified for If-Range
+        self.reset()
+        self.failures = 0
+        self.dropped = False
+
+    def reset(self):
+        """Forget the measurements of an earlier run."""
+        self.active = 0  # Workers fetching from it right now
+        self.fetched = 0  # Bytes received from it this run
+        self.rate = None  # Smoothed bytes/s per connection, kept while idle; None = not measured yet
+        self.busy_time = 0  # Seconds it had at least one worker
+        self.connection_time = 0  # Connection-seconds since the last observe()
+        self.changed_at = time()
+        self.last_fetched = 0
+
+    def expected_rate(self):
+        """What one more connection to this mirror would likely get."""
+        if self.rate is None:
+            # Unmeasured mirrors get one connection first, then no more until it has a rate
+            return 0 if self.active else float("inf")
+        return self.rate * self.active / (self.active + 1) if self.active else self.rate
+
+    def add_connection(self, delta, now):
+        """Count a worker starting (+1) or stopping (-1) on this mirror (task lock held)."""
+        self.settle(now)
+        self.active += delta
+
+    def settle(self, now):
+        """Add the time since the last change to the busy and connection totals."""
+        elapsed = now - self.changed_at
+        self.changed_at = now
+        if self.active:
+            self.busy_time += elapsed
+            self.connection_time += elapsed * self.active
+
+    def observe(self, now):
+        """Fold the bytes received since the last call into the per-connection rate.
+
+        Bytes are divided by connection-seconds rather than by the workers
+        running right now, so workers finishing just before a sample don't
+        inflate it, and an idle mirror keeps the rate it last had.
+        """
+        self.settle(now)
+        received = self.fetched - self.last_fetched
+        self.last_fetched = self.fetched
+        if self.connection_time > 0:
+            sample = received / self.connection_time
+            self.rate = sample if self.rate is None else (self.rate + sample) / 2
+        self.connection_time = 0
+
+
+class Segment:
+    """A byte range [start, end) of a download and how much of it is on disk."""
+
+    def __init__(self, start, end, done=0):
+        self.start = start
+        self.end = end
+        self.done = done  # Bytes committed to the file from start onwards
+        self.active = False  # A worker is currently downloading this segment
+        self.claimed_at = 0  # When the current worker picked it up
+        self.fetched = 0  # Bytes written by the current worker
+        self.in_flight = 0  # Bytes past position being written right now
+        self.failures = 0  # Failed attempts at this range
+        self.retry_at = 0  # Not claimed again before this time
+        self.mirror = None  # Mirror the current worker fetches it from
+        self.response = None  # Response the current worker is reading
+
+    def seconds_left(self, now):
+        """Estimated time for the current worker to finish this segment."""
+        elapsed = now - self.claimed_at
+        if self.fetched <= 0 or elapsed <= 0:
+            return float("inf")  # No data yet: treat as the slowest
+        return self.remaining / (self.fetched / elapsed)
+
+    @property
+    def position(self):
+        return self.start + self.done
+
+    @property
+    def remaining(self):
+        return self.end - self.position
+
+    def to_dict(self):
+        return {"start": self.start, "end": self.end, "done": self.done}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(int(data["start"]), int(data["end"]), int(data["done"]))
+
 
 class DownloadTask:
-    def __init__(self, url, dest_folder, filename=None, retries=3):
+    """A single download. Consumers follow it through add_listener().
+
+    Listeners are called as callback(task, event, **details) from the
+    download threads. Events are:
+      "status"    -- details: status (e.g. "Downloading", "Paused")
+      "completed" -- the file is fully written
+      "failed"    -- details: message; no more retries will be made
+      "cancelled" -- the task was cancelled and its file removed
+
+    Byte progress is not an event: workers only bump their segment's counter
+    and consumers call sample_progress() at whatever rate suits them.
+
+    Progress is kept in a sidecar state file (file_path + STATE_SUFFIX) so
+    pause/resume, retries and restarts after a crash only fetch missing bytes.
+    """
+
+    def __init__(self, url, dest_folder, filename=None, retries=3, num_threads=NUM_THREADS, pool=None,
+                 autotune=True, checksum=None, checksum_url=None, block_checksums=None, mirrors=None):
         self.url = url
+        self.mirror_urls = [url] + [m for m in (mirrors or []) if m != url]  # Same file on other servers
+        self.mirrors = []  # Mirror objects that matched the primary this run
+        self.pool = pool or http_pool
         self.dest_folder = dest_folder
         self.filename = filename or os.path.basename(url)
         self.file_path = os.path.join(dest_folder, self.filename)
+        self.state_path = self.file_path + STATE_SUFFIX
         self.total_size = 0
-        self.downloaded_size = 0
+        self.status = "Waiting"
         self.is_paused = False
         self.is_cancelled = False
         self.is_completed = False
+        self.is_failed = False
         self.speed = 0  # Download speed in MB/s
         self.time_left = "Calculating..."  # Time left for download
+        self.speed_samples = deque()  # (time, downloaded_size) pairs within SPEED_WINDOW
         self.retry_count = 0
         self.max_retries = retries
+        self.num_threads = num_threads  # Upper bound on connections
+        self.autotune = autotune  # Let a ConnectionTuner choose how many to use
+        self.tuner = None
+        self.live_workers = 0
         self.file_handle = None
         self.start_time = 0
-        self.download_speed_limit = DEFAULT_SPEED_LIMIT
+        self.start_size = 0  # Bytes already on disk when this run started
+        self.download_speed_limit = 0  # Per-task cap in MB/s, 0 = only the global limit
+        self.limiter = TokenBucket()
         self.scheduler_time = None  # Time for scheduled downloads
+        self.priority = 0  # Lower numbers leave the queue first
+        self.queue = None  # DownloadQueue that starts and retries this task, if any
+        self.budget = None  # ConnectionBudget shared with other tasks, if any
+        self.segment_failures = 0  # Segment failures since the last start()
         self.threads = []  # Initialize an empty list to track threads
+        self.listeners = []  # Event callbacks, see class docstring
+        self.finished = threading.Event()  # Set once completed, failed or cancelled
+        self.segments = []
+        self.etag = None
+        self.last_modified = None
+        self.lock = threading.Lock()  # Guards file writes, segment progress and state saves
+        self.run_lock = threading.Lock()  # Only one start() may run at a time
+        self.last_state_save = 0
+        self.checksum = checksum  # "sha256:<hex>" or a bare hex digest
+        self.checksum_url = checksum_url  # .sha256/.md5 sidecar to read the digest from
+        self.block_checksums = block_checksums  # {"algorithm", "block_size", "hashes"} for block repair
+        self.verifier = None
+        self.metrics = None  # TaskMetrics of the current or last attempt
+        self.attempts = 0
+        self.probe = None  # probe_url() result from a bulk import, used instead of the next HEAD
+        self.first_response = None  # Open response of the fast-start GET until a worker takes it
+        self.single_stream = False  # No ranges or no size: one connection, no resume
+        self.store_id = None  # Row in the TaskStore, if the engine keeps one
+        self.aborted = False  # A worker hit a fatal error: the others stop too
+        self.best_mirror_rate = 0  # Fastest per-connection rate any mirror reached this run
+
+    def add_listener(self, callback):
+        """Register callback(task, event, **details) for this task's events."""
+        self.listeners.append(callback)
+
+    def emit(self, event, **details):
+        """Send an event to every listener; a broken listener never kills a download."""
+        if event == "status":
+            self.status = details["status"]
+        for callback in list(self.listeners):
+            try:
+                callback(self, event, **details)
+            except Exception as e:
+                logging.error(f"Listener error on {event} for {self.filename}: {e}")
 
     def start(self):
-        """Starts the download."""
+        """Starts the download, or resumes it from the saved state file."""
+        with self.run_lock:
+            self.attempts += 1
+            self.metrics = metrics_registry.begin(self, self.attempts)
+            try:
+                logging.info(f"Starting download for {self.filename}")
+
+                if not is_valid_url(self.url):
+                    raise ValueError(f"Invalid URL: {self.url}")
+
+                # Get file size, validators and Range support: a new download learns
+                # them from its first GET, a resume or a mirrored download asks first
+                if FAST_START and not (self.probe or os.path.exists(self.state_path) or len(self.mirror_urls) > 1):
+                    self.first_response, info = self.open_first_range()
+                    if info is None:
+                        return  # Paused or cancelled while waiting to retry
+                else:
+                    info = self.fetch_info()
+                self.total_size = info["size"]
+                self.etag = info["etag"]
+                self.last_modified = info["last_modified"]
+                # Without ranges or a size there is nothing to split: stream it on one connection
+                self.single_stream = not (info["ranges"] and self.total_size)
+                self.mirrors = [] if self.single_stream else self.probe_mirrors()
+
+                saved_segments = None if self.single_stream else self.load_state()
+                if saved_segments:
+                    self.segments = saved_segments
+                    logging.info(f"Resuming {self.filename} from saved state")
+                    # Reopen without truncating so committed bytes survive
+                    self.file_handle = PositionalFile(self.file_path, self.total_size, truncate=False)
+                else:
+                    if self.single_stream:
+                        self.segments = [Segment(0, self.total_size)]
+                    elif self.first_response is not None:
+                        # The first GET already carries the start of the file
+                        first_end = min(FIRST_RANGE_SIZE, self.total_size)
+                        self.segments = [Segment(0, first_end)] + self.plan_segments(first_end)
+                    else:
+                        self.segments = self.plan_segments()
+                    self.file_handle = PositionalFile(self.file_path, self.total_size, truncate=True)
+
+                self.start_size = self.downloaded_size
+                self.start_time = time()  # Track when the download starts
+                self.speed_samples.clear()
+                self.save_state()
+                self.emit("status", status="Downloading")
+
+                self.verifier = self.start_verifier()
+
+                # Workers pull segments and steal work from each other until none is left
+                for segment in self.segments:
+                    segment.active = False
+                if self.single_stream:
+                    self.stream_whole()
+                else:
+                    self.tuner = ConnectionTuner(self.url, self.num_threads) if self.autotune else None
+                    self.run_workers()
+
+                if self.is_paused or self.is_cancelled:
+                    return
+
+                if all(segment.remaining <= 0 for segment in self.segments):
+                    if self.verifier:
+                        self.verify_download()
+                    self.is_completed = True
+                    self.file_handle.close()
+                    self.remove_state()
+                    logging.info(f"Download completed for {self.filename}")
+                    self.emit("status", status="Completed")
+                    self.emit("completed")
+
+            except (ResourceChangedError, ChecksumMismatchError) as e:
+                logging.error(f"Starting {self.filename} over: {e}")
+                if self.verifier:
+                    self.verifier.stop()
+                self.file_handle.close()
+                self.remove_state()
+                self.retry_or_fail()
+                if self.is_failed and isinstance(e, ChecksumMismatchError) and os.path.exists(self.file_path):
+                    # Never leave a file that failed verification under its real name
+                    os.replace(self.file_path, self.file_path + ".corrupt")
+                    logging.error(f"Kept the unverified download as {self.file_path}.corrupt")
+
+            except Exception as e:
+                logging.error(f"Error downloading {self.filename}: {e}")
+                self.retry_or_fail()
+
+            finally:
+                if self.first_response is not None:
+                    self.first_response.close()  # Paused or failed before a worker took it
+                    self.first_response = None
+                metrics_registry.end(self.metrics, "completed" if self.is_completed else
+                                     "cancelled" if self.is_cancelled else
+                                     "paused" if self.is_paused else
+                                     "failed" if self.is_failed else "retrying")
+                if self.verifier:
+                    self.verifier.stop()  # Before the file it reads from is closed
+                if self.file_handle:
+                    if not self.file_handle.closed and not self.is_completed and not self.is_cancelled:
+                        self.save_state()  # Keep what we have for the next attempt
+                    self.file_handle.close()  # Ensure file handle is closed
+                if self.is_completed or self.is_failed:
+                    self.finished.set()  # Last, so waiters find metrics and files written
+
+    def open_first_range(self):
+        """GET the first FIRST_RANGE_SIZE bytes; return the open response and what it says about the file.
+
+        Small files arrive whole in this one round trip. For bigger ones the
+        body becomes the first segment, and a 206 answer's Content-Range gives
+        the size needed to split the rest. Failures that a segment would retry
+        are retried the same way, after a backoff or the server's Retry-After;
+        (None, None) means the task was paused or cancelled meanwhile.
+        """
+        failures = 0
+        while True:
+            try:
+                return self.request_first_range()
+            except (requests.HTTPError, *retryable_errors()) as e:
+                response = getattr(e, "response", None)
+                if isinstance(e, requests.HTTPError) and (response is None or response.status_code not in RETRYABLE_STATUS):
+                    raise
+                failures += 1
+                if failures > SEGMENT_RETRIES:
+                    raise
+                delay = retry_after_seconds(response, default=None) if response is not None else None
+                if delay is None:
+                    delay = backoff_seconds(failures)
+                self.metrics.record_retry()
+                logging.warning(f"First request for {self.filename} failed ({e}); retry {failures} in {delay:.1f}s")
+                retry_at = time() + delay
+                while time() < retry_at:
+                    if self.is_paused or self.is_cancelled:
+                        return None, None
+                    sleep(min(0.1, max(0, retry_at - time())))
+
+    def request_first_range(self):
+        """One attempt of open_first_range()."""
+        headers = {'Range': f'bytes=0-{FIRST_RANGE_SIZE - 1}', 'Accept-Encoding': 'identity'}
+        response = self.pool.get(self.url, headers=headers, stream=True)
+        info = {
+            "etag": response.headers.get('ETag'),
+            "last_modified": response.headers.get('Last-Modified'),
+            "ranges": response.status_code == 206,
+            "time": time(),
+        }
+        if response.status_code == 206:
+            total = response.headers.get('Content-Range', '').rpartition('/')[2]
+            if not total.isdigit():
+                response.close()  # Size unknown ("*"): fetch the whole body on its own instead
+                return None, dict(info, size=0, ranges=False)
+            info["size"] = int(total)
+        elif response.ok:
+            info["size"] = int(response.headers.get('content-length', 0))  # Whole body, maybe unsized
+        elif response.status_code == 416 and response.headers.get('Content-Range', '').endswith('/0'):
+            response.close()  # "bytes */0": the file is empty, and a plain GET returns that
+            return None, dict(info, size=0, ranges=False)
+        else:
+            response.close()
+            response.raise_for_status()
+        return response, info
+
+    def fetch_info(self):
+        """Size, validators and Range support from a recent import probe, or from a new HEAD."""
+        probe, self.probe = self.probe, None  # A retry asks the server again
+        if probe and time() - probe["time"] < PROBE_MAX_AGE:
+            return probe
+        return probe_url(self.pool, self.url)
+
+    def probe_mirrors(self):
+        """HEAD the other mirrors and keep the ones serving the same file as the primary."""
+        primary = Mirror(self.url)
+        primary.validator = self.etag or self.last_modified
+        mirrors = [primary]
+        if len(self.mirror_urls) == 1:
+            return mirrors
+
+        def head(url):
+            try:
+                return url, self.pool.head(url, allow_redirects=True)
+            except requests.RequestException as e:
+                return url, e
+
+        with concurrent_futures.ThreadPoolExecutor(max_workers=len(self.mirror_urls) - 1) as executor:
+            for url, response in executor.map(head, self.mirror_urls[1:]):
+                if isinstance(response, Exception) or not response.ok:
+                    logging.warning(f"Skipping mirror {url} for {self.filename}: {response}")
+                    continue
+                size = int(response.headers.get('content-length', 0))
+                etag = response.headers.get('ETag')
+                if size != self.total_size or (self.etag and etag and etag != self.etag):
+                    logging.warning(f"Skipping mirror {url} for {self.filename}: size or ETag differs")
+                    continue
+                mirror = Mirror(url)
+                mirror.validator = etag or response.headers.get('Last-Modified')
+                mirrors.append(mirror)
+        logging.info(f"Downloading {self.filename} from {len(mirrors)} mirrors")
+        return mirrors
+
+    def pick_mirror(self):
+        """The live mirror where one more connection should be fastest (lock held)."""
+        live = [m for m in self.mirrors if not m.dropped]
+        # Spread connections over mirrors that have not been measured yet
+        return max(live, key=lambda m: (m.expected_rate(), -m.active)) if live else None
+
+    def drop_mirror(self, mirror, reason):
+        """Stop using a mirror unless it is the last one left (lock held).
+
+        The ranges its workers still hold are cut off where they are and
+        left for workers on the other mirrors to claim right away.
+        """
+        if mirror.dropped:
+            return True
+        if sum(not m.dropped for m in self.mirrors) <= 1:
+            return False
+        mirror.dropped = True
+        logging.warning(f"Dropped mirror {mirror.url} for {self.filename}: {reason}")
+        for segment in list(self.segments):
+            if segment.active and segment.mirror is mirror:
+                self.split_segment(segment, segment.position + segment.in_flight)
+        return True
+
+    def review_mirrors(self, now):
+        """Update mirror speeds and drop ones that fell far behind the best.
+
+        A mirror is judged after MIRROR_JUDGE_SECONDS of use, against the best
+        per-connection rate any mirror has reached this run, busy or not: fast
+        mirrors run out of work first and would otherwise leave the slow one
+        with nothing to be compared to.
+        """
+        if len(self.mirrors) < 2:
+            return
+        with self.lock:
+            for mirror in self.mirrors:
+                mirror.observe(now)
+            rates = [m.rate for m in self.mirrors if m.rate is not None]
+            if rates:
+                self.best_mirror_rate = max(self.best_mirror_rate, *rates)
+            best = self.best_mirror_rate
+            for mirror in self.mirrors:
+                if not mirror.dropped and mirror.busy_time >= MIRROR_JUDGE_SECONDS and mirror.rate < best * MIRROR_SLOW_RATIO:
+                    self.drop_mirror(mirror, f"{mirror.rate / 1024 / 1024:.2f} MB/s per connection "
+                                             f"vs {best / 1024 / 1024:.2f} MB/s")
+
+    def start_verifier(self):
+        """Start hashing in the background if there is anything to verify against."""
+        algorithm = expected = None
+        if self.checksum:
+            algorithm, expected = parse_checksum(self.checksum)
+        elif self.checksum_url:
+            response = self.pool.get(self.checksum_url, timeout=30)
+            response.raise_for_status()
+            extension = os.path.splitext(urlsplit(self.checksum_url).path)[1].lstrip(".").lower()
+            algorithm, expected = parse_checksum(response.text, extension if extension in hashlib.algorithms_available else None)
+        if not expected and not self.block_checksums:
+            return None
+        return StreamVerifier(self, algorithm, expected, self.block_checksums)
+
+    def verify_download(self):
+        """Finish hashing, re-fetch bad blocks, and raise if the file is still wrong."""
+        self.emit("status", status="Verifying")
+        self.verifier.finish()
+        repaired = False
+        for index in list(self.verifier.bad_blocks):
+            start = index * self.verifier.block_size
+            end = min(start + self.verifier.block_size, self.total_size)
+            logging.info(f"Re-fetching block {index} of {self.filename}")
+            self.repair_range(start, end)
+            if not self.verifier.check_block(index):
+                raise ChecksumMismatchError(f"block {index} is still wrong after re-fetching it")
+            repaired = True
+        if repaired and self.verifier.file_digest:
+            self.verifier.rehash_file()  # The digest saw the bad bytes
+        if not self.verifier.matches():
+            # Without block digests there is no telling which bytes are wrong
+            raise ChecksumMismatchError(f"{self.verifier.algorithm} of {self.filename} does not match")
+        logging.info(f"Verified {self.filename}")
+
+    def repair_range(self, start, end):
+        """Fetch bytes [start, end) again and overwrite them in place."""
+        headers = {'Range': f'bytes={start}-{end - 1}', 'Accept-Encoding': 'identity'}
+        with self.pool.get(self.url, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise ResourceChangedError(f"server ignored Range while repairing {self.url}")
+            offset = start
+            for chunk in iter_body(response, CHUNK_SIZE):
+                chunk = chunk[:end - offset]
+                self.file_handle.write_at(chunk, offset)
+                offset += len(chunk)
+                if offset >= end:
+                    break
+
+    def plan_segments(self, offset=0):
+        """Split bytes offset..total_size into up to num_threads equal ranges of at least MIN_SEGMENT_SIZE."""
+        size = self.total_size - offset
+        if size <= 0:
+            return []
+        count = max(1, min(self.num_threads, size // MIN_SEGMENT_SIZE))
+        chunk_size = size // count  # Divide into chunks
+        segments = []
+        for i in range(count):
+            start = offset + i * chunk_size
+            end = start + chunk_size if i < count - 1 else self.total_size
+            segments.append(Segment(start, end))
+        return segments
+
+    def wanted_workers(self):
+        return self.tuner.connections if self.tuner else self.num_threads
+
+    def run_workers(self):
+        """Keep as many workers running as the tuner wants until the download stops."""
+        self.live_workers = 0
+        self.segment_failures = 0
+        self.aborted = False
+        futures = set()
+        last_time, last_size = time(), self.downloaded_size
+        for mirror in self.mirrors:
+            mirror.reset()
+        self.best_mirror_rate = 0
+        with concurrent_futures.ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            while not (self.is_paused or self.is_cancelled):
+                if all(segment.remaining <= 0 for segment in self.segments):
+                    break
+                if not self.tuner or time() >= self.tuner.resume_at:
+                    with self.lock:
+                        # Don't start workers that would find nothing to take or steal
+                        now = time()
+                        claimable = sum(1 for s in self.segments if s.remaining > 0 and
+                                        (not s.active and s.retry_at <= now or self.stealable(s, now)))
+                        launch = max(0, min(self.wanted_workers() - self.live_workers, claimable))
+                        if self.budget and launch:
+                            launch = self.budget.acquire(launch, self.live_workers)
+                        self.live_workers += launch
+                    for _ in range(launch):
+                        futures.add(executor.submit(self.run_worker))
+                if not futures:
+                    sleep(0.1)  # Waiting out a backoff, a Retry-After or the connection budget
+                    continue
+                done, futures = concurrent_futures.wait(futures, timeout=TUNE_INTERVAL,
+                                                        return_when=concurrent_futures.FIRST_EXCEPTION)
+                for future in done:
+                    try:
+                        future.result()  # Re-raise a worker's error
+                    except Exception:
+                        self.aborted = True  # Don't let leaving the executor wait for the rest of the file
+                        raise
+                now, size = time(), self.downloaded_size
+                if self.tuner and now > last_time:
+                    self.tuner.observe((size - last_size) / (now - last_time), self.live_workers)
+                self.review_mirrors(now)
+                last_time, last_size = now, size
+        if self.tuner:
+            self.tuner.save()
+
+    def run_worker(self):
+        """Download segments until there is nothing left to take or steal."""
+        retired = False
         try:
-            logging.info(f"Starting download for {self.filename}")
-
-            if not is_valid_url(self.url):
-                raise ValueError(f"Invalid URL: {self.url}")
-
-            # Get file size
-            response = requests.head(self.url)
-            self.total_size = int(response.headers.get('content-length', 0))
-
-            # Open file in binary mode for writing
-            self.file_handle = open(self.file_path, 'wb')
-
-            self.start_time = time()  # Track when the download starts
-
-            # Download using multiple threads (chunked download)
-            with ThreadPoolExecutor(max_workers=NUM_THREADS) as executor:
-                futures = []
-                chunk_size = self.total_size // NUM_THREADS  # Divide into chunks
-
-                for i in range(NUM_THREADS):
-                    start = i * chunk_size
-                    end = start + chunk_size if i < NUM_THREADS - 1 else self.total_size
-                    futures.append(executor.submit(self.download_chunk, start, end))
-
-                for future in futures:
-                    future.result()  # Wait for all threads to finish
-
-            if self.downloaded_size >= self.total_size:
-                self.is_completed = True
-                update_gui(self, status="Completed")
-                logging.info(f"Download completed for {self.filename}")
-                check_if_all_downloads_completed()  # Check if we should close the app
-
+            segment = self.next_segment()
+            while segment is not None:
+                with self.lock:
+                    mirror = self.pick_mirror()
+                    mirror.add_connection(1, time())
+                    segment.mirror = mirror
+                try:
+                    self.download_chunk(segment, mirror)
+                except requests.HTTPError as e:
+                    status = e.response.status_code if e.response is not None else None
+                    if status not in RETRYABLE_STATUS:
+                        if not self.mirror_failed(mirror, e, fatal=True):
+                            raise  # No other mirror left to serve the file
+                    else:
+                        delay = self.segment_failed(segment, e, retry_after_seconds(e.response, default=None))
+                        if self.tuner and status in (429, 503) and mirror.url == self.url:
+                            self.tuner.throttled(delay)
+                            if self.tuner.throttle_count > TUNE_MAX_THROTTLES:
+                                raise
+                            return  # The segment goes back to the others
+                        self.mirror_failed(mirror, e)
+                except ResourceChangedError as e:
+                    # The primary decides what the file is; a mirror that disagrees just goes
+                    if mirror.url == self.url or not self.mirror_failed(mirror, e, fatal=True):
+                        raise
+                except retryable_errors() as e:
+                    self.segment_failed(segment, e)
+                    self.mirror_failed(mirror, e)
+                finally:
+                    with self.lock:
+                        segment.active = False
+                        segment.mirror = None
+                        mirror.add_connection(-1, time())
+                if self.is_paused or self.is_cancelled or self.aborted:
+                    return
+                if self.retire_if_surplus():
+                    retired = True
+                    return
+                segment = self.next_segment()
+        finally:
+            if not retired:
+                self.worker_exited()
+
+    def mirror_failed(self, mirror, error, fatal=False):
+        """Count a failure against a mirror; True if it was dropped and others remain."""
+        with self.lock:
+            mirror.failures += 1
+            if fatal or mirror.failures >= MIRROR_MAX_FAILURES:
+                return self.drop_mirror(mirror, error)
+        return False
+
+    def segment_failed(self, segment, error, delay=None):
+        """Count a failed range and hold it back for a while; raise once a budget is spent.
+
+        Only the missing part of the segment is fetched again, after the
+        server's Retry-After or an exponential backoff with jitter.
+        """
+        with self.lock:
+            segment.failures += 1
+            self.segment_failures += 1
+            if segment.failures > SEGMENT_RETRIES or self.segment_failures > TASK_SEGMENT_RETRIES:
+                raise error
+            if delay is None:
+                delay = backoff_seconds(segment.failures)
+            segment.retry_at = time() + delay
+        self.metrics.record_retry()
+        logging.warning(f"Segment {segment.position}-{segment.end} of {self.filename} failed ({error}); "
+                        f"retry {segment.failures} in {delay:.1f}s")
+        return delay
+
+    def retire_if_surplus(self):
+        """Atomically stop this worker if more are running than the tuner wants."""
+        with self.lock:
+            if self.live_workers > self.wanted_workers():
+                self.worker_exited(locked=True)
+                return True
+        return False
+
+    def worker_exited(self, locked=False):
+        """Give a worker's connection back to the task and the shared budget."""
+        if not locked:
+            with self.lock:
+                return self.worker_exited(locked=True)
+        self.live_workers -= 1
+        if self.budget:
+            self.budget.release()
+
+    def next_segment(self):
+        """Claim an idle segment, or split the slowest active one in half."""
+        if self.aborted:
+            return None
+        with self.lock:
+            now = time()
+            segment = next((s for s in self.segments if not s.active and s.remaining > 0 and s.retry_at <= now), None)
+            if segment is None:
+                segment = self.steal_segment(now)
+            if segment is not None:
+                segment.active = True
+                segment.claimed_at = now
+                segment.fetched = 0
+            return segment
+
+    def stealable(self, segment, now):
+        """Whether an idle worker could take part of this active segment (lock held)."""
+        free = segment.remaining - segment.in_flight
+        if not segment.active or free <= 0:
+            return False
+        if free >= 2 * MIN_SEGMENT_SIZE:
+            return True
+        # Endgame: a small tail is only worth taking from a connection that is slow or stalled
+        return (segment.seconds_left(now) >= ENDGAME_SECONDS and
+                (segment.fetched > 0 or now - segment.claimed_at >= ENDGAME_SECONDS))
+
+    def steal_segment(self, now):
+        """Take the back half of the active segment that will finish last (lock held).
+
+        Once no segment is big enough to halve, the slowest tail is halved down
+        to ENDGAME_MIN_SEGMENT instead, and a tail smaller than that is taken
+        over whole, so one slow connection can't keep the others waiting.
+        """
+        candidates = [s for s in self.segments if self.stealable(s, now)]
+        if not candidates:
+            return None
+        victim = max(candidates, key=lambda s: (s.remaining - s.in_flight >= 2 * MIN_SEGMENT_SIZE,
+                                                 s.seconds_left(now), s.remaining))
+        start = victim.position + victim.in_flight
+        if victim.end - start < 2 * ENDGAME_MIN_SEGMENT:
+            logging.info(f"Took over bytes {start}-{victim.end} of {self.filename} from a slow connection")
+            return self.split_segment(victim, start)
+        middle = start + (victim.end - start) // 2
+        logging.info(f"Split {self.filename} at byte {middle} to help a slow connection")
+        return self.split_segment(victim, middle)
+
+    def split_segment(self, segment, at):
+        """Cut segment at byte `at` and return the new segment after it (lock held)."""
+        tail = Segment(at, segment.end)
+        segment.end = at  # Its worker stops when it reaches the new end
+        self.segments.insert(self.segments.index(segment) + 1, tail)
+        if segment.response is not None and at <= segment.position + segment.in_flight:
+            # Nothing left for its worker: don't let a slow or stalled read keep it (and the task) waiting
+            interrupt_response(segment.response)
+        return tail
+
+    def download_chunk(self, segment, mirror=None):
+        """Download the missing part of a segment, from the primary URL or a mirror."""
+        if segment.remaining <= 0:
+            return
+        url = mirror.url if mirror else self.url
+        # Ranges of a compressed representation can't be stitched together
+        headers = {'Range': f'bytes={segment.position}-{segment.end - 1}', 'Accept-Encoding': 'identity'}
+        if_range = mirror.validator if mirror else self.etag or self.last_modified
+        if (segment.done or mirror and mirror.url != self.url) and if_range:
+            headers['If-Range'] = if_range  # Server sends the whole file if it changed
+
+        with self.lock:
+            response = None
+            if self.first_response is not None and segment.position == 0:
+                response, self.first_response = self.first_response, None  # Already open from start()
+
+        record = self.metrics.begin_request(segment.position, segment.end, url)
+        error = None
+        try:
+            with response or self.pool.get(url, headers=headers, stream=True) as response:
+                with self.lock:
+                    segment.response = response
+                self.metrics.record_headers(record, response.elapsed.total_seconds())
+                response.raise_for_status()
+                if 'If-Range' in headers and response.status_code != 206:
+                    raise ResourceChangedError(f"server ignored If-Range for {url}")
+                if response.status_code != 206 and url != self.url:
+                    raise ResourceChangedError(f"mirror {url} ignored the Range header")
+                if response.status_code != 206 and segment.position > 0:
+                    # The body starts at byte 0, not here; the next attempt streams it on one connection
+                    raise ResourceChangedError(f"server ignored the Range header for {url}")
+                base_read_size = self.tuner.read_size if self.tuner else CHUNK_SIZE
+                read_size = min(self.limiter.read_size(base_read_size), bandwidth_limiter.read_size(base_read_size))
+                received_at = perf_counter()
+                for chunk in iter_body(response, read_size):
+                    waited = perf_counter() - received_at  # Time spent waiting on the socket
+                    self.throttle(len(chunk))
+                    if self.is_cancelled or self.is_paused or self.aborted:
+                        return  # Exit if canceled, paused or failed; progress is in the state file
+                    if self.live_workers > self.wanted_workers():
+                        return  # The tuner backed off; hand the rest of the segment back
+                    if mirror and mirror.dropped:
+                        return  # Let a faster mirror finish this segment
+                    with self.lock:
+                        chunk = chunk[:segment.remaining]  # The segment may have been split meanwhile
+                        offset = segment.position
+                        segment.in_flight = len(chunk)  # Keeps a concurrent split out of this range
+                    # Written outside the lock so segments hit the disk in parallel
+                    write_started = perf_counter()
+                    self.file_handle.write_at(chunk, offset)
+                    self.metrics.record_read(record, len(chunk), waited, perf_counter() - write_started)
+                    with self.lock:
+                        segment.done += len(chunk)
+                        segment.fetched += len(chunk)
+                        segment.in_flight = 0
+                        segment.failures = 0  # The budget counts failures in a row
+                        if mirror:
+                            mirror.fetched += len(chunk)
+                        if time() - self.last_state_save >= STATE_SAVE_INTERVAL:
+                            self.save_state(locked=True)
+                    if segment.remaining <= 0:
+                        return
+                    received_at = perf_counter()
+            if segment.remaining > 0:
+                # The server closed the connection before the end of the range
+                raise http_client.IncompleteRead(b"", segment.remaining)
+        except retryable_errors() as e:
+            if segment.remaining <= 0:
+                return  # Interrupted after another worker took the rest over
+            error = e
+            raise
         except Exception as e:
-            logging.error(f"Error downloading {self.filename}: {e}")
-            self.retry_or_fail()
-
+            error = e
+            raise
         finally:
-            if self.file_handle:
-                self.file_handle.close()  # Ensure file handle is closed
-
-    def download_chunk(self, start, end):
-        """Download a chunk of the file."""
-        headers = {'Range': f'bytes={start}-{end - 1}'}
-
-        with requests.get(self.url, headers=headers, stream=True) as response:
-            self.file_handle.seek(start)
-            for chunk in response.iter_content(CHUNK_SIZE):
-                if self.is_cancelled:
-                    return  # Exit if canceled
-                while self.is_paused:
-                    sleep(1)  # Sleep while paused
-                self.file_handle.write(chunk)
-                self.downloaded_size += len(chunk)
-                elapsed_time = time() - self.start_time
-                self.speed = self.downloaded_size / (elapsed_time * 1024 * 1024)  # Speed in MB/s
-                if self.download_speed_limit > 0:
-                    self.speed = min(self.speed, self.download_speed_limit)
-                self.time_left = self.calculate_time_left()
-                update_gui(self, status="Downloading")
+            with self.lock:
+                segment.response = None
+            self.metrics.end_request(record, error)
+
+    def stream_whole(self):
+        """Download the file over one connection, for servers without ranges or a known size."""
+        segment = self.segments[0]
+        record = self.metrics.begin_request(0, self.total_size, self.url)
+        error = None
+        try:
+            response, self.first_response = self.first_response, None
+            if response is None:
+                response = self.pool.get(self.url, headers={'Accept-Encoding': 'identity'}, stream=True)
+            with response:
+                self.metrics.record_headers(record, response.elapsed.total_seconds())
+                response.raise_for_status()
+                read_size = min(self.limiter.read_size(CHUNK_SIZE), bandwidth_limiter.read_size(CHUNK_SIZE))
+                received_at = perf_counter()
+                for chunk in iter_body(response, read_size):
+                    waited = perf_counter() - received_at
+                    self.throttle(len(chunk))
+                    if self.is_cancelled or self.is_paused:
+                        return  # Nothing to resume from: the next start() begins again
+                    write_started = perf_counter()
+                    self.file_handle.write_at(chunk, segment.done)
+                    self.metrics.record_read(record, len(chunk), waited, perf_counter() - write_started)
+                    with self.lock:
+                        segment.done += len(chunk)
+                        segment.fetched += len(chunk)
+                        segment.end = max(segment.end, segment.done)  # Grows when the size is unknown
+                    received_at = perf_counter()
+            if segment.done < self.total_size:
+                raise http_client.IncompleteRead(b"", self.total_size - segment.done)
+            self.total_size = segment.done  # Now known even without a content-length
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.metrics.end_request(record, error)
+
+    def committed_prefix(self):
+        """How many bytes from the start of the file are on disk without a gap."""
+        position = 0
+        for segment in sorted(list(self.segments), key=lambda s: s.start):
+            if segment.start > position:
+                break
+            position = max(position, segment.position)
+            if segment.remaining > 0:
+                break
+        return position
+
+    @property
+    def downloaded_size(self):
+        """Bytes on disk, summed from the per-segment counters."""
+        return sum(segment.done for segment in list(self.segments))
+
+    def sample_progress(self, now=None):
+        """Refresh speed and time_left from a sliding window of recent progress."""
+        now = now or time()
+        downloaded = self.downloaded_size
+        samples = self.speed_samples
+        if self.status != "Downloading":
+            samples.clear()
+            self.speed = 0
+            self.time_left = "0 min 0 sec" if self.is_completed else "Calculating..."
+            return downloaded
+        samples.append((now, downloaded))
+        while len(samples) > 2 and now - samples[0][0] > SPEED_WINDOW:
+            samples.popleft()
+        oldest_time, oldest_size = samples[0]
+        if now > oldest_time:
+            self.speed = (downloaded - oldest_size) / ((now - oldest_time) * 1024 * 1024)  # Speed in MB/s
+        self.time_left = self.calculate_time_left()
+        return downloaded
+
+    def set_speed_limit(self, mb_per_second):
+        """Cap this task's speed (0 = only the global limit applies)."""
+        self.download_speed_limit = mb_per_second
+        self.limiter.set_rate(mb_per_second * 1024 * 1024)
+
+    def throttle(self, amount):
+        """Block until both the task's and the global limit allow amount bytes."""
+        should_stop = lambda: self.is_cancelled or self.is_paused or self.aborted
+        self.limiter.consume(amount, should_stop)
+        bandwidth_limiter.consume(amount, should_stop)
+
+    def load_state(self):
+        """Return the saved segments if they still describe the remote file, else None."""
+        if not os.path.exists(self.state_path) or not os.path.exists(self.file_path):
+            return None
+        try:
+            with open(self.state_path, 'r') as state_file:
+                state = json.load(state_file)
+            segments = [Segment.from_dict(data) for data in state["segments"]]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.error(f"Ignoring unreadable state file for {self.filename}: {e}")
+            return None
+
+        # Without a validator we cannot tell whether the file changed, so start over
+        if not (self.etag or self.last_modified):
+            return None
+        if (state.get("url") != self.url or state.get("total_size") != self.total_size
+                or state.get("etag") != self.etag or state.get("last_modified") != self.last_modified):
+            logging.info(f"Remote file changed for {self.filename}, discarding saved progress")
+            return None
+        return segments
+
+    def save_state(self, locked=False):
+        """Write segment progress to the sidecar file (atomically)."""
+        if not locked:
+            with self.lock:
+                return self.save_state(locked=True)
+        if self.single_stream:
+            return  # A single stream always starts again from byte 0
+        state = {
+            "url": self.url,
+            "total_size": self.total_size,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "segments": [segment.to_dict() for segment in self.segments],
+        }
+        temp_path = self.state_path + ".tmp"
+        try:
+            with open(temp_path, 'w') as state_file:
+                json.dump(state, state_file)
+            os.replace(temp_path, self.state_path)
+        except OSError as e:
+            logging.error(f"Could not save state for {self.filename}: {e}")
+        self.last_state_save = time()
+
+    def remove_state(self):
+        """Delete the sidecar state file."""
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
 
     def retry_or_fail(self):
         """Retry the download or fail after max retries."""
+        if self.is_cancelled:
+            return
         if self.retry_count < self.max_retries:
             self.retry_count += 1
             logging.info(f"Retrying download for {self.filename}, attempt {self.retry_count}")
-            root.after(DEFAULT_RETRY_INTERVAL * 1000, lambda: self.start())  # Retry after interval
+            if self.queue:
+                self.queue.submit(self, at=time() + DEFAULT_RETRY_INTERVAL, status="Retrying")
+            else:
+                self.emit("status", status="Retrying")
+                timer = threading.Timer(DEFAULT_RETRY_INTERVAL, self.start)  # Retry after interval
+                timer.daemon = True
+                timer.start()
         else:
-            update_gui(self, status="Error")
-            messagebox.showerror("Error", f"Failed to download {self.filename} after {self.max_retries} retries.")
+            self.is_failed = True
+            self.emit("status", status="Error")
+            self.emit("failed", message=f"Failed to download {self.filename} after {self.max_retries} retries.")
 
     def pause(self):
-        """Pauses the download."""
+        """Pauses the download; workers stop after saving their progress."""
+        if self.is_completed or self.is_failed:
+            return  # Nothing left to pause (Pause All also reaches finished tasks)
         self.is_paused = True
-        update_gui(self, status="Paused")
+        self.emit("status", status="Paused")
 
     def resume(self):
-        """Resumes the download."""
+        """Resumes the download from the saved state, or waits again for its scheduled time."""
         if self.is_paused:
             self.is_paused = False
-            update_gui(self, status="Downloading")
-            threading.Thread(target=self.start).start()  # Resume in a new thread
+            start_at = self.scheduler_time.timestamp() if self.scheduler_time else None
+            if self.queue:
+                self.queue.submit(self, at=start_at)  # Waits for its time and a free slot like any other task
+            elif start_at and start_at > time():
+                self.emit("status", status="Scheduled")  # The timer from schedule() still starts it
+            else:
+                self.emit("status", status="Downloading")
+                threading.Thread(target=self.start).start()  # Resume in a new thread
 
     def cancel(self):
         """Cancels the download and removes the file."""
         self.is_cancelled = True  # Set the flag to cancel download
         logging.info(f"Download canceled for {self.filename}")
 
-        # Wait briefly to allow threads to stop
-        sleep(1)
+        # Wait briefly to allow threads to stop; if they are still running,
+        # start() closes the file itself so no worker writes to a closed fd
+        stopped = self.run_lock.acquire(timeout=1)
 
         try:
             # Close the file handle if it is open
-            if self.file_handle and not self.file_handle.closed:
+            if stopped and self.file_handle and not self.file_handle.closed:
                 self.file_handle.close()
 
-            # Once cancellation is confirmed, remove the file
+            # Once cancellation is confirmed, remove the file and its state
             if os.path.exists(self.file_path):
                 os.remove(self.file_path)
-            remove_task_from_gui(self)  # Remove the task from the GUI
+            self.remove_state()
+            self.emit("cancelled")
+            self.finished.set()
         except PermissionError as e:
-            update_gui(self, status="Error")
-            messagebox.showerror("Error", f"Error canceling {self.filename}: {e}")
+            self.emit("status", status="Error")
+            self.emit("failed", message=f"Error canceling {self.filename}: {e}")
+        finally:
+            if stopped:
+                self.run_lock.release()
 
     def calculate_time_left(self):
         """Calculate time left for download completion."""
-        if self.speed > 0:
+        if self.speed > 0 and self.total_size:
             remaining_size = (self.total_size - self.downloaded_size) / (1024 * 1024)  # Remaining size in MB
             time_left = remaining_size / self.speed  # Time left in seconds
             return f"{int(time_left // 60)} min {int(time_left % 60)} sec"
         return "Calculating..."
 
     def schedule(self, schedule_time):
-        """Schedule the download to start at a later time."""
+        """Schedule the download to start at a later time (never blocks)."""
         self.scheduler_time = schedule_time
-        delay = (schedule_time - datetime.now()).total_seconds()
         logging.info(f"Scheduling download for {self.filename} at {schedule_time.strftime('%Y-%m-%d %H:%M:%S')}")
-        scheduler.enter(delay, 1, lambda: self.start())
-        scheduler.run()
-
+        if self.queue:
+            self.queue.submit(self, at=schedule_time.timestamp())
+        else:
+            delay = max(0, (schedule_time - datetime.now()).total_seconds())
+            timer = threading.Timer(delay, self.start)
+            timer.daemon = True
+            timer.start()
+            self.emit("status", status="Scheduled")
+
+
+class DownloadQueue:
+    """Starts tasks in priority order without ever blocking the caller.
+
+    Scheduled tasks and retries wait in a heap keyed by start time. One
+    background thread moves them to the ready heap when they are due and
+    starts ready tasks while fewer than max_active are running, so queued
+    tasks cost no threads. Lower priority numbers start first; ties keep the
+    order tasks were queued in.
+    """
+
+    def __init__(self, max_active=MAX_ACTIVE_DOWNLOADS, budget=None):
+        self.max_active = max_active
+        self.budget = budget
+        self.timers = []  # (start time, seq, task)
+        self.ready = []  # (priority, seq, task)
+        self.entries = {}  # task -> (seq, "timer" or "ready") of its live entry; others are stale
+        self.active = {}  # task -> number of running start() calls
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def submit(self, task, at=None, status=None):
+        """Queue a task now, or at the time.time() value `at`."""
+        with self.condition:
+            seq = next(self.counter)
+            if at and at > time():
+                heapq.heappush(self.timers, (at, seq, task))
+                self.entries[task] = (seq, "timer")
+                status = status or "Scheduled"
+            else:
+                heapq.heappush(self.ready, (task.priority, seq, task))
+                self.entries[task] = (seq, "ready")
+                status = status or "Queued"
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="download-queue", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        task.emit("status", status=status)
+
+    def set_priority(self, task, priority):
+        """Reorder a waiting task (lower numbers start first)."""
+        with self.condition:
+            task.priority = priority
+            entry = self.entries.get(task)
+            if entry and entry[1] == "ready":
+                seq = next(self.counter)
+                heapq.heappush(self.ready, (priority, seq, task))  # The old entry goes stale
+                self.entries[task] = (seq, "ready")
+                self.condition.notify()
+
+    def move_to_front(self, task):
+        with self.condition:
+            waiting = [entry[2].priority for entry in self.ready if self.entries.get(entry[2], (None,))[0] == entry[1]]
+            front = min(waiting, default=task.priority)
+        self.set_priority(task, min(front - 1, task.priority))
+
+    def set_max_active(self, max_active):
+        with self.condition:
+            self.max_active = max(1, max_active)
+            self.condition.notify()
+
+    def waiting(self):
+        """Number of tasks queued or scheduled but not running."""
+        with self.condition:
+            return len(self.entries)
+
+    def run(self):
+        while True:
+            to_start = []
+            with self.condition:
+                now = time()
+                while self.timers and self.timers[0][0] <= now:
+                    _, seq, task = heapq.heappop(self.timers)
+                    if self.entries.get(task) == (seq, "timer"):
+                        heapq.heappush(self.ready, (task.priority, seq, task))
+                        self.entries[task] = (seq, "ready")
+                while self.ready and len(self.active) + len(to_start) < self.max_active:
+                    _, seq, task = heapq.heappop(self.ready)
+                    if self.entries.get(task) != (seq, "ready"):
+                        continue  # Reprioritised or resubmitted since
+                    del self.entries[task]
+                    if task.is_paused or task.is_cancelled or task.is_completed:
+                        continue
+                    to_start.append(task)
+                for task in to_start:
+                    self.active[task] = self.active.get(task, 0) + 1
+                if self.budget:
+                    self.budget.active_tasks = len(self.active)
+                if not to_start:
+                    timeout = self.timers[0][0] - now if self.timers else None
+                    self.condition.wait(timeout)
+            for task in to_start:
+                thread = threading.Thread(target=self.run_task, args=(task,), daemon=True)
+                task.threads.append(thread)  # Track the thread
+                thread.start()
+
+    def run_task(self, task):
+        try:
+            task.start()  # start() sends the only HEAD request
+        finally:
+            with self.condition:
+                self.active[task] -= 1
+                if not self.active[task]:
+                    del self.active[task]
+                if self.budget:
+                    self.budget.active_tasks = len(self.active)
+                self.condition.notify()
+
+
+class DownloadEngine:
+    """Owns a set of DownloadTasks and runs them; usable with or without a GUI."""
+
+    def __init__(self, num_threads=NUM_THREADS, retries=3, pool=None, task_speed_limit=0, autotune=True,
+                 max_active=MAX_ACTIVE_DOWNLOADS, connection_budget=CONNECTION_BUDGET, store=None):
+        self.num_threads = num_threads
+        self.autotune = autotune
+        self.budget = ConnectionBudget(connection_budget)
+        self.queue = DownloadQueue(max_active, self.budget)
+        self.retries = retries
+        self.pool = pool or http_pool
+        self.task_speed_limit = task_speed_limit  # MB/s cap for each new task
+        self.tasks = []
+        self.listeners = []  # Attached to every task this engine creates
+        self.store = store  # TaskStore that keeps tasks between runs, if any
+        self.folders = set()  # Destination folders known to exist
+
+    def add_listener(self, callback):
+        """Register callback(task, event, **details) for all current and future tasks."""
+        self.listeners.append(callback)
+        for task in self.tasks:
+            task.add_listener(callback)
+
+    def add(self, url, dest_folder, filename=None, schedule_time=None, start=True, checksum=None,
+            checksum_url=None, priority=0, mirrors=None, store_id=None, block_checksums=None):
+        """Create a task for url, optionally scheduling or starting it right away.
+
+        store_id is the database row of a task being restored; restore() hands
+        such tasks to the store itself.
+        """
+        if dest_folder not in self.folders:  # Restoring thousands of tasks checks each folder once
+            if not os.path.exists(dest_folder):
+                os.makedirs(dest_folder)  # Create the folder if it doesn't exist
+            self.folders.add(dest_folder)
+
+        task = DownloadTask(url, dest_folder, filename, retries=self.retries,
+                            num_threads=self.num_threads, pool=self.pool, autotune=self.autotune,
+                            checksum=checksum, checksum_url=checksum_url, block_checksums=block_checksums,
+                            mirrors=mirrors)
+        if self.task_speed_limit:
+            task.set_speed_limit(self.task_speed_limit)
+        task.priority = priority
+        task.queue = self.queue
+        task.budget = self.budget
+        for callback in self.listeners:
+            task.add_listener(callback)
+        self.tasks.append(task)
+        if self.store and store_id is None:
+            self.store.add(task)
+
+        if schedule_time:
+            task.schedule(schedule_time)
+        elif start:
+            self.start(task)
+        return task
+
+    def add_many(self, urls, dest_folder, start=True, workers=PROBE_WORKERS):
+        """Create a task per URL and probe them all in the background.
+
+        Tasks are queued in list order right away. One thread feeds the URLs
+        to probe_urls(), and each answer is kept on its task so start() can
+        skip its own HEAD; tasks the queue reaches first just send one.
+        """
+        tasks = {}
+        for url in urls:
+            if url not in tasks:
+                tasks[url] = self.add(url, dest_folder, start=start)
+
+        def probe_all():
+            started = time()
+            failed = 0
+            for url, info in probe_urls(self.pool, list(tasks), workers):
+                if isinstance(info, Exception):
+                    failed += 1
+                    logging.warning(f"Probe failed for {url}: {info}")
+                    continue
+                task = tasks[url]
+                if task.status in ("Waiting", "Queued", "Scheduled"):
+                    task.total_size = info["size"]
+                    task.probe = info
+            logging.info(f"Probed {len(tasks)} URLs in {time() - started:.1f} s ({failed} failed)")
+
+        threading.Thread(target=probe_all, name="url-probe", daemon=True).start()
+        return list(tasks.values())
+
+    def start(self, task):
+        """Queue a task; it starts as soon as a slot is free."""
+        self.queue.submit(task)
+
+    def remove(self, task):
+        """Forget a task (does not cancel it)."""
+        if task in self.tasks:
+            self.tasks.remove(task)
+        if self.store:
+            self.store.remove(task)
+
+    def restore(self, after_id=0, limit=RESTORE_PAGE_ROWS):
+        """Recreate the next page of unfinished tasks saved in the store and queue them as they were.
+
+        Returns up to `limit` tasks from rows after after_id, oldest first;
+        callers ask for the next page after the last task's store_id. The
+        rows already describe these tasks, so restoring them writes nothing.
+        """
+        tasks = []
+        # The queue can't start a task before the store listens to it, and the
+        # status events sent while restoring reach everyone but the store
+        with self.queue.condition:
+            for row in self.store.unfinished(after_id, limit):
+                schedule_time = datetime.fromtimestamp(row["scheduled_at"]) if row["scheduled_at"] else None
+                if schedule_time and schedule_time <= datetime.now():
+                    schedule_time = None  # Missed while the app was closed: start now
+                task = self.add(row["url"], row["dest_folder"], row["filename"], start=False,
+                                checksum=row["checksum"], checksum_url=row["checksum_url"], priority=row["priority"],
+                                mirrors=json.loads(row["mirrors"] or "[]"), store_id=row["id"],
+                                block_checksums=json.loads(row["block_checksums"]) if row["block_checksums"] else None)
+                task.total_size = row["total_size"] or 0
+                if row["speed_limit"]:
+                    task.set_speed_limit(row["speed_limit"])
+                if row["status"] == "Paused":
+                    task.pause()
+                elif schedule_time:
+                    task.schedule(schedule_time)
+                else:
+                    self.start(task)
+                self.store.add(task, row["id"])
+                tasks.append(task)
+        if tasks:
+            logging.info(f"Restored {len(tasks)} unfinished downloads")
+        return tasks
+
+    def sample_progress(self):
+        """Update speed and time left of every task; call this periodically."""
+        now = time()
+        for task in list(self.tasks):
+            task.sample_progress(now)
+
+    def pause_all(self):
+        for task in self.tasks:
+            task.pause()
+
+    def resume_all(self):
+        for task in self.tasks:
+            task.resume()
+
+    def wait(self, timeout=None):
+        """Block until every task has completed, failed or been cancelled."""
+        deadline = time() + timeout if timeout is not None else None
+        for task in list(self.tasks):
+            remaining = None if deadline is None else max(0, deadline - time())
+            if not task.finished.wait(remaining):
+                return False
+        return True
+
+
+class TaskStore:
+    """Downloads and per-host settings kept in an SQLite database in WAL mode.
+
+    Nothing is written on download threads: events only mark a task dirty.
+    A writer thread saves every dirty task, plus the progress of running
+    ones, in one transaction each STORE_FLUSH_INTERVAL. Finished tasks are
+    never turned back into DownloadTasks; history() returns plain rows.
+    """
+
+    COLUMNS = ("id", "url", "dest_folder", "filename", "status", "priority", "scheduled_at", "checksum",
+               "checksum_url", "mirrors", "speed_limit", "total_size", "downloaded", "updated_at",
+               "block_checksums")
+
+    def __init__(self, path=TASK_DB_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")  # Readers never wait for the writer
+        self.db.execute("PRAGMA synchronous=NORMAL")  # Survives a crash of the app; a power cut may lose the last second
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY, url TEXT NOT NULL, "
+                            "dest_folder TEXT, filename TEXT, status TEXT, priority INTEGER, scheduled_at REAL, "
+                            "checksum TEXT, checksum_url TEXT, mirrors TEXT, speed_limit REAL, "
+                            "total_size INTEGER, downloaded INTEGER, updated_at REAL)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS hosts (host TEXT PRIMARY KEY, settings TEXT)")
+            columns = {row["name"] for row in self.db.execute("PRAGMA table_info(tasks)")}
+            if "block_checksums" not in columns:  # Databases from before block digests were stored
+                self.db.execute("ALTER TABLE tasks ADD COLUMN block_checksums TEXT")
+        last_id = self.db.execute("SELECT MAX(id) FROM tasks").fetchone()[0]
+        self.ids = itertools.count((last_id or 0) + 1)  # Ids are handed out without touching the database
+        self.lock = threading.Lock()  # Guards the pending changes below; held only to swap them
+        self.db_lock = threading.Lock()  # Guards the connection while a query or a flush runs
+        self.dirty = set()  # Tasks to write at the next flush
+        self.live = set()  # Running tasks, written every flush for their progress
+        self.removed = []  # Ids to delete
+        self.dirty_hosts = {}  # host -> settings to write
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="task-store", daemon=True)
+        self.thread.start()
+
+    def add(self, task, store_id=None):
+        """Start keeping a task; store_id is its existing row when it was restored.
+
+        A restored task is only written again once something about it changes.
+        """
+        task.add_listener(self.on_task_event)
+        if store_id:
+            task.store_id = store_id
+        else:
+            task.store_id = next(self.ids)
+            self.touch(task)
+
+    def touch(self, task):
+        """Save the task at the next flush (e.g. after its priority changed)."""
+        with self.lock:
+            self.dirty.add(task)
+
+    def remove(self, task):
+        with self.lock:
+            self.dirty.discard(task)
+            self.live.discard(task)
+            self.removed.append(task.store_id)
+
+    def on_task_event(self, task, event, status=None, message=None):
+        with self.lock:
+            if event == "cancelled":
+                return  # remove() deletes the row
+            self.dirty.add(task)
+            if status in ("Downloading", "Verifying"):
+                self.live.add(task)
+            elif event == "status":
+                self.live.discard(task)
+
+    def save_host(self, host, settings):
+        with self.lock:
+            self.dirty_hosts[host] = dict(settings)
+
+    def load_hosts(self):
+        with self.db_lock:
+            rows = self.db.execute("SELECT host, settings FROM hosts").fetchall()
+        return {row["host"]: json.loads(row["settings"]) for row in rows}
+
+    def unfinished(self, after_id=0, limit=RESTORE_PAGE_ROWS):
+        """The next `limit` tasks after row after_id that still have work to do, oldest first."""
+        placeholders = ", ".join("?" * len(FINISHED_STATUSES))
+        with self.db_lock:
+            return self.db.execute(f"SELECT * FROM tasks WHERE id > ? AND status NOT IN ({placeholders}) "
+                                   f"ORDER BY id LIMIT ?", (after_id, *FINISHED_STATUSES, limit)).fetchall()
+
+    def history(self, after_id=0, limit=HISTORY_PAGE_ROWS):
+        """The next `limit` finished tasks after row after_id, oldest first.
+
+        Pages follow the primary key, so each one costs the same however
+        long the history is and nothing past it is read.
+        """
+        placeholders = ", ".join("?" * len(FINISHED_STATUSES))
+        with self.db_lock:
+            return self.db.execute(f"SELECT id, filename, status, total_size, downloaded FROM tasks "
+                                   f"WHERE id > ? AND status IN ({placeholders}) ORDER BY id LIMIT ?",
+                                   (after_id, *FINISHED_STATUSES, limit)).fetchall()
+
+    def task_row(self, task, now):
+        return (task.store_id, task.url, task.dest_folder, task.filename, task.status, task.priority,
+                task.scheduler_time.timestamp() if task.scheduler_time else None, task.checksum,
+                task.checksum_url, json.dumps(task.mirror_urls[1:]), task.download_speed_limit,
+                task.total_size, task.downloaded_size, now,
+                json.dumps(task.block_checksums) if task.block_checksums else None)
+
+    def flush(self):
+        """Write everything that changed since the last flush in one transaction."""
+        with self.lock:
+            tasks = self.dirty | self.live
+            removed, hosts = self.removed, self.dirty_hosts
+            self.dirty, self.removed, self.dirty_hosts = set(), [], {}
+        if not (tasks or removed or hosts):
+            return
+        now = time()
+        rows = [self.task_row(task, now) for task in tasks]
+        # Events keep marking tasks dirty while this runs; they never wait for the disk
+        with self.db_lock:
+            try:
+                with self.db:
+                    self.db.executemany(f"INSERT OR REPLACE INTO tasks ({', '.join(self.COLUMNS)}) "
+                                        f"VALUES ({', '.join('?' * len(self.COLUMNS))})", rows)
+                    self.db.executemany("DELETE FROM tasks WHERE id = ?", [(task_id,) for task_id in removed])
+                    self.db.executemany("INSERT OR REPLACE INTO hosts (host, settings) VALUES (?, ?)",
+                                        [(host, json.dumps(settings)) for host, settings in hosts.items()])
+            except sqlite3.Error as e:
+                logging.error(f"Could not save tasks to {self.path}, will try again: {e}")
+                with self.lock:  # Put the changes back; anything newer wins
+                    self.dirty |= tasks
+                    self.removed = removed + self.removed
+                    self.dirty_hosts = dict(hosts, **self.dirty_hosts)
+
+    def run(self):
+        while not self.stopped.wait(STORE_FLUSH_INTERVAL):
+            self.flush()
+
+    def close(self):
+        """Write what is still pending and close the database."""
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.flush()
+        with self.db_lock:
+            self.db.close()
+
+
+###############################################################################
+# Command line interface
+###############################################################################
+
+# Print task events on the terminal for headless runs
+def print_task_event(task, event, status=None, message=None):
+    if event == "status":
+        print(f"{task.filename}: {status}")
+    elif event == "failed":
+        print(f"{task.filename}: {message}", file=sys.stderr)
+    elif event == "completed":
+        print(f"{task.filename}: saved to {task.file_path}")
+
+
+def run_fetch(args):
+    pool = SessionPool(max_size=args.pool_size)
+    set_global_speed_limit(args.limit)
+    metrics_registry.enabled = not args.no_metrics
+    engine = DownloadEngine(num_threads=args.threads, retries=args.retries, pool=pool,
+                            task_speed_limit=args.task_limit, autotune=not args.no_tune,
+                            max_active=args.max_active, connection_budget=args.connections)
+    engine.add_listener(print_task_event)
+
+    text = "\n".join(args.urls)
+    if args.input == "-":
+        text += "\n" + sys.stdin.read()
+    elif args.input:
+        with open(args.input, encoding="utf-8") as f:
+            text += "\n" + f.read()
+    urls, rejected = read_url_list(text)
+    for line in rejected:
+        print(f"Skipping invalid URL: {line}", file=sys.stderr)
+    if not urls:
+        print("No URLs to download", file=sys.stderr)
+        return 2
+
+    if (args.checksum or args.checksum_url or args.block_checksums or args.mirror) and len(urls) > 1:
+        print("--checksum, --checksum-url, --block-checksums and --mirror need exactly one URL", file=sys.stderr)
+        return 2
+
+    block_checksums = None
+    if args.block_checksums:
+        try:
+            block_checksums = load_block_checksums(args.block_checksums)
+        except (OSError, ValueError) as e:
+            print(f"Could not read --block-checksums: {e}", file=sys.stderr)
+            return 2
+
+    if len(urls) == 1:
+        engine.add(urls[0], args.dest, checksum=args.checksum, checksum_url=args.checksum_url,
+                   block_checksums=block_checksums, mirrors=args.mirror)
+    else:
+        engine.add_many(urls, args.dest, workers=args.probe_workers)
+
+    engine.wait()
+    for host, counts in pool.stats().items():
+        print(f"{host}: {counts['requests']} requests over {counts['connections']} connections "
+              f"({counts['reused']} reused)")
+        logging.info(f"Connection reuse for {host}: {counts}")
+    pool.close()
+    return 0 if engine.tasks and all(task.is_completed for task in engine.tasks) else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="sdm", description="SlowDownloadManager")
+    commands = parser.add_subparsers(dest="command")
+
+    fetch_parser = commands.add_parser("fetch", help="Download URLs without opening the GUI")
+    fetch_parser.add_argument("urls", nargs="*", metavar="URL")
+    fetch_parser.add_argument("-i", "--input", metavar="FILE", help="Also read URLs from FILE, one per line ('-' for stdin)")
+    fetch_parser.add_argument("--probe-workers", type=int, default=PROBE_WORKERS,
+                              help="HEAD requests sent at once when checking many URLs")
+    fetch_parser.add_argument("--threads", type=int, default=NUM_THREADS, help="Most connections per download")
+    fetch_parser.add_argument("--no-tune", action="store_true", help="Always use --threads connections instead of tuning per host")
+    fetch_parser.add_argument("--dest", default=os.path.join(os.getcwd(), "Downloads"), help="Folder to save into")
+    fetch_parser.add_argument("--retries", type=int, default=3, help="Retries per download")
+    fetch_parser.add_argument("--limit", type=float, default=DEFAULT_SPEED_LIMIT, help="Total speed limit in MB/s (0 = none)")
+    fetch_parser.add_argument("--task-limit", type=float, default=0, help="Speed limit per download in MB/s (0 = none)")
+    fetch_parser.add_argument("--max-active", type=int, default=MAX_ACTIVE_DOWNLOADS, help="Downloads running at once")
+    fetch_parser.add_argument("--connections", type=int, default=CONNECTION_BUDGET, help="Connections shared by all downloads")
+    fetch_parser.add_argument("--checksum", help="Expected digest, e.g. sha256:<hex>")
+    fetch_parser.add_argument("--checksum-url", help="URL of a .sha256/.md5 file with the expected digest")
+    fetch_parser.add_argument("--block-checksums", metavar="FILE",
+                              help='JSON {"algorithm", "block_size", "hashes"}; bad blocks are re-fetched on their own')
+    fetch_parser.add_argument("--mirror", action="append", default=[], metavar="URL",
+                              help="Another URL serving the same file; may be repeated")
+    fetch_parser.add_argument("--no-metrics", action="store_true",
+                              help=f"Don't write {METRICS_JSONL_PATH} and {METRICS_PROM_PATH}")
+    fetch_parser.add_argument("--pool-size", type=int, default=POOL_MAX_SIZE, help="Keep-alive connections per host")
+
+    commands.add_parser("gui", help="Open the download manager window (default)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print import and first-window times, then exit (the GUI) or carry on (fetch)")
+
+    args = parser.parse_args(argv)
+    if args.profile_startup:
+        report_startup("import", IMPORT_FINISHED)
+    if args.command == "fetch":
+        return run_fetch(args)
+    run_gui(profile_startup=args.profile_startup)
+    return 0
+
+
+def report_startup(stage, at=None):
+    """Print how long sdm.py took to reach a stage and which lazy modules it had to load."""
+    elapsed = ((at or perf_counter()) - IMPORT_STARTED) * 1000
+    loaded = [name for name in LAZY_MODULES if name in sys.modules]
+    print(f"{stage}: {elapsed:.1f} ms (lazy modules loaded: {', '.join(loaded) or 'none'})", file=sys.stderr)
+
+
+###############################################################################
+# Tk GUI (one consumer of the engine)
+###############################################################################
+
+engine = DownloadEngine()
+task_store = None  # TaskStore opened by run_gui
+root = None
+close_on_complete = None
+task_view = None  # ttk.Treeview with one row per task; it only draws the rows in view
+gui_events = queue.Queue()  # Engine events waiting for the Tk thread
+task_rows = {}  # task -> Treeview row id, in the order tasks were added
+row_tasks = {}  # Treeview row id -> task
+live_tasks = set()  # Tasks whose progress changes between events; only these are redrawn every tick
+shown_rows = {}  # task -> last values drawn, so unchanged rows are skipped
+LIVE_STATUSES = {"Downloading", "Verifying"}
+TASK_COLUMNS = (("file", "File", 300), ("progress", "Progress", 170), ("status", "Status", 90),
+                ("speed", "Speed", 90), ("time_left", "Time Left", 110))
+
+# Engine events arrive on download threads; only queue them here
+def on_task_event(task, event, status=None, message=None):
+    gui_events.put((task, event, message))
+
+# Runs on the Tk thread every PROGRESS_INTERVAL_MS: handle events, redraw what changed
+def gui_tick():
+    changed = set()
+    completed = False
+    while True:
+        try:
+            task, event, message = gui_events.get_nowait()
+        except queue.Empty:
+            break
+        if task not in task_rows:
+            continue
+        changed.add(task)
+        if event == "status":
+            if task.status in LIVE_STATUSES:
+                live_tasks.add(task)
+            else:
+                live_tasks.discard(task)
+        elif event == "completed":
+            completed = True
+        elif event == "failed":
+            messagebox.showerror("Error", message)
+        elif event == "cancelled":
+            remove_task_from_gui(task)  # Remove the task from the GUI
+            changed.discard(task)
+
+    # Queued, paused and finished rows only change on events, so thousands of them cost nothing here
+    now = time()
+    for task in changed | live_tasks:
+        task.sample_progress(now)
+        update_gui(task)
+    if completed:
+        check_if_all_downloads_completed()  # Check if we should close the app
+    root.after(PROGRESS_INTERVAL_MS, gui_tick)
+
+# Text of one task list row
+def row_values(filename, downloaded, total_size, status, speed=0, time_left=""):
+    progress = (downloaded / total_size) * 100 if total_size else 0
+    speed = f"{speed:.2f} MB/s" if speed > 0 else "0 MB/s"
+    filled = int(progress // 10)
+    return (filename, f"{'█' * filled}{'░' * (10 - filled)} {progress:6.2f}%", status, speed, time_left)
 
 # GUI Update Function
-def update_gui(task, status):
-    index = task_list.index(task)
-    progress = (task.downloaded_size / task.total_size) * 100 if task.total_size else 0
-    progress_bars[index]['value'] = progress  # Update progress bar
-    progress_labels[index].config(text=f"{progress:.2f}%")
-    status_labels[index].config(text=status)
-    if task.speed > 0:
-        speed_labels[index].config(text=f"{task.speed:.2f} MB/s")
-    time_left_labels[index].config(text=task.time_left)  # Show time left
+def update_gui(task):
+    values = row_values(task.filename, task.downloaded_size, task.total_size, task.status, task.speed, task.time_left)
+    if shown_rows.get(task) == values:
+        return  # Nothing changed since the last tick
+    shown_rows[task] = values
+    task_view.item(task_rows[task], values=values)
 
 # Function to check if all downloads are completed
 def check_if_all_downloads_completed():
-    if all(task.is_completed for task in task_list):
+    if all(task.is_completed for task in task_rows):
         if close_on_complete.get():
             root.after(1000, root.quit)  # Close after 1 second if the option is enabled
 
-# Function to start download in a new thread
-def download_thread(task):
-    if task.total_size == 0:
-        response = requests.head(task.url)
-        content_length = response.headers.get('content-length', 0)
-        if content_length:
-            task.total_size = int(content_length)
-
-    if task.total_size > 0:
-        task.start()
-
 # Add a new download with the Add Download Window
 def open_add_download_window():
     add_window = tk.Toplevel(root)
     add_window.title("Add Download")
-    add_window.geometry("450x550")
-    
+    add_window.geometry("450x650")
+
     # Ensure the add window stays on top of the main window
     add_window.transient(root)
     add_window.grab_set()
 
-    # Toggle scheduler display based on checkbox
+    # Date and time pickers are only built once "Schedule Download" is ticked
+    schedule_widgets = {}
+
     def toggle_scheduler_display():
         if schedule_checkbox.get():
-            cal.pack(pady=10)
-            tk.Label(add_window, text="Choose Time:").pack(pady=5)
-            time_box.pack(pady=5)
+            if not schedule_widgets:
+                tkcalendar = optional_module("tkcalendar")  # Calendar widget for date selection
+                if tkcalendar is None:
+                    schedule_checkbox.set(False)
+                    messagebox.showwarning("Unavailable", "Scheduling needs the tkcalendar package.")
+                    return
+                schedule_widgets["cal"] = tkcalendar.Calendar(schedule_frame, selectmode="day", date_pattern="mm/dd/yy")
+                schedule_widgets["cal"].pack(pady=10)
+                tk.Label(schedule_frame, text="Choose Time:").pack(pady=5)
+                schedule_widgets["time_box"] = ttk.Combobox(schedule_frame, values=[f"{i:02d}:00" for i in range(24)], width=5)
+                schedule_widgets["time_box"].current(0)
+                schedule_widgets["time_box"].pack(pady=5)
+            schedule_frame.pack(after=schedule_button)
         else:
-            cal.pack_forget()
-            time_box.pack_forget()
-
-    # Create Date Picker for scheduling
-    cal = Calendar(add_window, selectmode="day", date_pattern="mm/dd/yy")
-    cal.pack_forget()  # Initially hidden
-    
-    tk.Label(add_window, text="Choose Time:").pack_forget()
-    time_box = ttk.Combobox(add_window, values=[f"{i:02d}:00" for i in range(24)], width=5)
-    time_box.current(0)
-    time_box.pack_forget()
-    
+            schedule_frame.pack_forget()
+
     schedule_checkbox = tk.BooleanVar()
-    tk.Checkbutton(add_window, text="Schedule Download", variable=schedule_checkbox, command=toggle_scheduler_display).pack()
+    schedule_button = tk.Checkbutton(add_window, text="Schedule Download", variable=schedule_checkbox, command=toggle_scheduler_display)
+    schedule_button.pack()
+    schedule_frame = tk.Frame(add_window)  # Holds the pickers; packed below the checkbox when shown
 
     # URL entry field
     tk.Label(add_window, text="Download URL:").pack(pady=5)
     url_entry = tk.Entry(add_window, width=50)
     url_entry.pack(pady=5)
-    
+
     # Auto paste from clipboard
-    clipboard_url = pyperclip.paste()
+    pyperclip = optional_module("pyperclip")  # Clipboard handling
+    try:
+        clipboard_url = pyperclip.paste() if pyperclip else root.clipboard_get()
+    except tk.TclError:
+        clipboard_url = ""  # Empty clipboard
     if is_valid_url(clipboard_url):
         url_entry.insert(0, clipboard_url)  # Automatically paste clipboard if valid URL
 
@@ -257,10 +2648,21 @@ def open_add_download_window():
     tk.Label(add_window, text="Save to Folder:").pack(pady=5)
     folder_entry = tk.Entry(add_window, width=50)
     folder_entry.pack(pady=5)
-    
+
     browse_button = tk.Button(add_window, text="Browse", command=lambda: browse_folder(folder_entry))
     browse_button.pack(pady=5)
 
+    # Optional checksum: a digest or the URL of a .sha256/.md5 file
+    tk.Label(add_window, text="Checksum (optional, sha256:... or URL):").pack(pady=5)
+    checksum_entry = tk.Entry(add_window, width=50)
+    checksum_entry.pack(pady=5)
+
+    # Optional block digest file, so a bad block is re-fetched instead of the whole file
+    tk.Label(add_window, text="Block checksums file (optional):").pack(pady=5)
+    blocks_entry = tk.Entry(add_window, width=50)
+    blocks_entry.pack(pady=5)
+    tk.Button(add_window, text="Browse", command=lambda: browse_file(blocks_entry)).pack(pady=5)
+
     # Add Download Button
     def add_download():
         url = url_entry.get()
@@ -268,29 +2670,74 @@ def open_add_download_window():
         if not url or not is_valid_url(url):
             messagebox.showwarning("Input Error", "Please enter a valid URL!")
             return
-        if not os.path.exists(dest_folder):
-            os.makedirs(dest_folder)  # Create the folder if it doesn't exist
-
-        task = DownloadTask(url, dest_folder)
-        task_list.append(task)
-        index = len(task_list) - 1
-        add_download_row(index, task)
 
+        schedule_time = None
         if schedule_checkbox.get():
-            date_str = cal.get_date()  # Get selected date from the calendar
-            time_str = time_box.get()  # Get selected time from dropdown
+            date_str = schedule_widgets["cal"].get_date()  # Get selected date from the calendar
+            time_str = schedule_widgets["time_box"].get()  # Get selected time from dropdown
             schedule_time = datetime.strptime(f"{date_str} {time_str}", "%m/%d/%y %H:%M")
-            task.schedule(schedule_time)  # Set up scheduling
-        else:
-            thread = threading.Thread(target=download_thread, args=(task,))
-            task.threads.append(thread)  # Track the thread
-            thread.start()
+
+        checksum = checksum_entry.get().strip()
+        checksum_url = checksum if is_valid_url(checksum) else None
+        if checksum and not checksum_url:
+            try:
+                parse_checksum(checksum)
+            except ValueError:
+                messagebox.showwarning("Input Error", "Please enter a checksum like sha256:<hex> or a checksum file URL!")
+                return
+
+        block_checksums = None
+        if blocks_entry.get().strip():
+            try:
+                block_checksums = load_block_checksums(blocks_entry.get().strip())
+            except (OSError, ValueError) as e:
+                messagebox.showwarning("Input Error", f"Could not read the block checksums file: {e}")
+                return
+
+        task = engine.add(url, dest_folder, schedule_time=schedule_time, start=False,
+                          checksum=None if checksum_url else checksum or None, checksum_url=checksum_url,
+                          block_checksums=block_checksums)
+        add_task_row(task)
+
+        if not schedule_time:
+            engine.start(task)
 
         add_window.destroy()  # Close the add download window
 
     add_button = tk.Button(add_window, text="Start Download", command=add_download)
     add_button.pack(pady=10)
 
+# Add every URL in a text file or on the clipboard, one per line
+def import_urls(source):
+    if source == "file":
+        path = filedialog.askopenfilename(title="Import URLs", filetypes=[("Text files", "*.txt"), ("All files", "*")])
+        if not path:
+            return
+        with open(path, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+    else:
+        pyperclip = optional_module("pyperclip")  # Clipboard handling
+        try:
+            text = pyperclip.paste() if pyperclip else root.clipboard_get()
+        except tk.TclError:
+            text = ""  # Empty clipboard
+
+    urls, rejected = read_url_list(text)
+    if not urls:
+        messagebox.showwarning("Import", "No valid URLs found.")
+        return
+    for task in engine.add_many(urls, os.path.join(os.getcwd(), "Downloads")):
+        add_task_row(task)
+    if rejected:
+        messagebox.showinfo("Import", f"Added {len(urls)} downloads, skipped {len(rejected)} invalid lines.")
+
+# Browse function to pick a file for an entry
+def browse_file(entry):
+    file_selected = filedialog.askopenfilename()
+    if file_selected:
+        entry.delete(0, tk.END)
+        entry.insert(0, file_selected)
+
 # Browse function to select folder
 def browse_folder(folder_entry):
     folder_selected = filedialog.askdirectory()
@@ -298,93 +2745,324 @@ def browse_folder(folder_entry):
     folder_entry.insert(0, folder_selected)
 
 # Add a new download row in the main UI
-def add_download_row(index, task):
-    row = index + 2
-
-    # Create a frame to hold each row's content
-    row_frame = tk.Frame(root)
-    row_frame.grid(row=row, column=0, columnspan=8, padx=5, pady=5, sticky="w")
-
-    file_name_label = tk.Label(row_frame, text=task.filename, width=30, anchor="w")
-    file_name_label.grid(row=0, column=0)
-
-    progress_bar = ttk.Progressbar(row_frame, length=200)
-    progress_bar.grid(row=0, column=1)
-    progress_bars.append(progress_bar)
-
-    progress_label = tk.Label(row_frame, text="0.00%", width=10, anchor="e")
-    progress_label.grid(row=0, column=2)
-    progress_labels.append(progress_label)
-
-    status_label = tk.Label(row_frame, text="Waiting", width=10, anchor="e")
-    status_label.grid(row=0, column=3)
-    status_labels.append(status_label)
-
-    speed_label = tk.Label(row_frame, text="0 MB/s", width=10, anchor="e")
-    speed_label.grid(row=0, column=4)
-    speed_labels.append(speed_label)
-
-    time_left_label = tk.Label(row_frame, text="Calculating...", width=15, anchor="e")
-    time_left_label.grid(row=0, column=5)
-    time_left_labels.append(time_left_label)
-
-    pause_button = tk.Button(row_frame, text="Pause", command=lambda: task.pause(), width=7)
-    pause_button.grid(row=0, column=6)
-
-    resume_button = tk.Button(row_frame, text="Resume", command=lambda: task.resume(), width=7)
-    resume_button.grid(row=0, column=7)
-
-    cancel_button = tk.Button(row_frame, text="Cancel", command=lambda: task.cancel(), width=7)
-    cancel_button.grid(row=0, column=8)
+def add_task_row(task, index="end"):
+    row = task_view.insert("", index)
+    task_rows[task] = row
+    row_tasks[row] = task
+    update_gui(task)
 
 # Function to remove a task from the GUI
 def remove_task_from_gui(task):
-    index = task_list.index(task)
-    task_list.remove(task)
-    progress_bars.pop(index)
-    progress_labels.pop(index)
-    status_labels.pop(index)
-    speed_labels.pop(index)
-    time_left_labels.pop(index)
-    refresh_gui()
-
-# Refresh the GUI after removing a task
-def refresh_gui():
-    for widget in root.grid_slaves():
-        if int(widget.grid_info()["row"]) > 1:
-            widget.grid_forget()
-
-    for index, task in enumerate(task_list):
-        add_download_row(index, task)
+    row = task_rows.pop(task, None)
+    if row is None:
+        return
+    del row_tasks[row]
+    task_view.delete(row)
+    live_tasks.discard(task)
+    shown_rows.pop(task, None)
+    engine.remove(task)
+
+# Tasks of the selected rows, for the toolbar buttons
+def selected_tasks():
+    return [row_tasks[row] for row in task_view.selection() if row in row_tasks]
+
+def pause_selected():
+    for task in selected_tasks():
+        task.pause()
+
+def resume_selected():
+    for task in selected_tasks():
+        task.resume()
+
+def cancel_selected():
+    for task in selected_tasks():
+        threading.Thread(target=task.cancel, daemon=True).start()  # cancel() waits for the workers
+
+def move_selected_to_front():
+    for task in reversed(selected_tasks()):
+        engine.queue.move_to_front(task)
+        if task_store:
+            task_store.touch(task)  # Keep the new priority
+
+# Open the task database, queue unfinished downloads again and list the finished ones
+def restore_tasks():
+    global task_store
+    task_store = TaskStore()
+    atexit.register(task_store.close)  # Writes the last progress on the way out
+    engine.store = task_store
+    host_profiles.store = task_store
+    # Unfinished tasks are recreated a page per tick, so the window shows up at once
+    root.after(0, add_restored_rows, 0, 0)
+
+def add_restored_rows(after_id, index):
+    tasks = engine.restore(after_id)
+    for task in tasks:
+        add_task_row(task, index)  # Above tasks added since startup
+        index += 1
+    if len(tasks) == RESTORE_PAGE_ROWS:
+        root.after(1, add_restored_rows, tasks[-1].store_id, index)
+    else:
+        # History rows are plain text, not tasks, and are read and listed a page per tick
+        root.after(1, add_history_rows, 0, 0)
+
+def add_history_rows(after_id, index):
+    rows = task_store.history(after_id)
+    for row in rows:
+        values = row_values(row["filename"], row["downloaded"], row["total_size"], row["status"])
+        task_view.insert("", index, values=values)  # Above this session's tasks
+        index += 1
+    if len(rows) == HISTORY_PAGE_ROWS:
+        root.after(1, add_history_rows, rows[-1]["id"], index)
 
 # Pause All and Resume All Functions
 def pause_all_downloads():
-    for task in task_list:
-        task.pause()
+    engine.pause_all()
 
 def resume_all_downloads():
-    for task in task_list:
-        task.resume()
+    engine.resume_all()
 
 # View Logs Function
+class LogReader:
+    """Reads a log file a page at a time backwards from the end, and whatever is appended later.
+
+    Lines come back as (byte offset, text) so the viewer can drop lines from
+    either end and still know where to carry on reading. With a filter only
+    matching lines are returned, but the whole range is still walked through.
+    """
+
+    def __init__(self, path, pattern=""):
+        self.path = path
+        self.pattern = pattern.lower()
+        try:
+            stat = os.stat(path)
+            self.inode, size = stat.st_ino, stat.st_size
+            with open(path, "rb") as f:
+                f.seek(max(0, size - LOG_PAGE_BYTES))
+                tail = f.read(size - f.tell())
+            size -= len(tail) - (tail.rfind(b"\n") + 1)  # Leave a half-written last line to newer()
+        except OSError:
+            self.inode, size = None, 0
+        self.top = size  # Lines before this offset have not been read yet
+        self.end = size  # Lines from this offset on have not been read yet
+
+    def split(self, data, offset):
+        """(offset, text) for each complete line in data, which starts at offset."""
+        lines = []
+        for raw in data.split(b"\n")[:-1]:
+            text = raw.decode("utf-8", "replace")
+            if not self.pattern or self.pattern in text.lower():
+                lines.append((offset, text))
+            offset += len(raw) + 1
+        return lines
+
+    def older(self):
+        """Up to about LOG_PAGE_LINES lines just before those already read, oldest first."""
+        lines = []
+        scanned = 0
+        page = LOG_PAGE_BYTES
+        try:
+            with open(self.path, "rb") as f:
+                while self.top > 0 and len(lines) < LOG_PAGE_LINES and scanned < LOG_SCAN_BYTES:
+                    start = max(0, self.top - page)
+                    f.seek(start)
+                    data = f.read(self.top - start)
+                    if start > 0:
+                        cut = data.find(b"\n", 0, len(data) - 1)  # The last byte ends the line before top
+                        if cut == -1:
+                            page *= 2  # A line longer than the page
+                            continue
+                        start += cut + 1  # Skip the partial first line; the next page has it
+                        data = data[cut + 1:]
+                    scanned += len(data)
+                    lines[:0] = self.split(data, start)
+                    self.top = start
+        except OSError:
+            self.top = 0
+        return lines
+
+    def newer(self):
+        """Complete lines appended since the last call, or None if the file was rotated."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None if self.inode else []
+        if stat.st_ino != self.inode or stat.st_size < self.end:
+            return None
+        if stat.st_size == self.end:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self.end)
+            data = f.read(stat.st_size - self.end)
+        complete = data.rfind(b"\n") + 1  # A half-written last line waits for the next call
+        lines = self.split(data[:complete], self.end)
+        self.end += complete
+        return lines
+
+
+# Log viewer: opens at the end of the log, loads older pages on demand and follows new lines
 def view_logs():
     log_window = tk.Toplevel(root)
     log_window.title("Download Logs")
-    log_window.geometry("500x300")
+    log_window.geometry("700x400")
+
+    controls = tk.Frame(log_window)
+    controls.pack(fill="x", padx=5, pady=5)
+    tk.Label(controls, text="Filter:").pack(side="left")
+    filter_entry = tk.Entry(controls, width=30)
+    filter_entry.pack(side="left", padx=5)
+    status_label = tk.Label(controls, anchor="e")
+    status_label.pack(side="right")
+
+    text_frame = tk.Frame(log_window)
+    text_frame.pack(fill="both", expand=True)
+    scrollbar = tk.Scrollbar(text_frame)
+    scrollbar.pack(side="right", fill="y")
+    log_text = tk.Text(text_frame, wrap="none", state=tk.DISABLED)
+    log_text.pack(side="left", fill="both", expand=True)
+
+    view = {"reader": None, "offsets": deque(), "loading": False}  # offsets[i] belongs to line i + 1
+
+    def at_bottom():
+        return log_text.yview()[1] >= 0.999
+
+    def show_status():
+        reader = view["reader"]
+        shown = len(view["offsets"])
+        more = "scroll up for older lines" if reader.top > 0 else "start of file"
+        status_label.config(text=f"{shown} lines, {more}")
+
+    def trim(from_top):
+        """Drop lines past LOG_VIEW_MAX_LINES from one end, remembering where to read them again."""
+        offsets = view["offsets"]
+        excess = len(offsets) - LOG_VIEW_MAX_LINES
+        if excess <= 0:
+            return
+        if from_top:
+            log_text.delete("1.0", f"{excess + 1}.0")
+            for _ in range(excess):
+                offsets.popleft()
+            view["reader"].top = offsets[0]
+        else:
+            keep = len(offsets) - excess
+            log_text.delete(f"{keep + 1}.0", "end-1c")
+            for _ in range(excess):
+                view["reader"].end = offsets.pop()
+
+    def load_older():
+        reader = view["reader"]
+        if view["loading"] or reader.top <= 0:
+            return
+        view["loading"] = True
+        lines = reader.older()
+        if lines:
+            log_text.config(state=tk.NORMAL)
+            log_text.insert("1.0", "".join(text + "\n" for _, text in lines))
+            view["offsets"].extendleft(offset for offset, _ in reversed(lines))
+            trim(from_top=False)
+            log_text.config(state=tk.DISABLED)
+            log_text.yview(f"{len(lines) + 1}.0")  # Keep the line that was on top in place
+        show_status()
+        view["loading"] = False
+
+    def load_newer():
+        if not log_window.winfo_exists():
+            return
+        if at_bottom():  # Someone reading older lines shouldn't have them scroll away
+            lines = view["reader"].newer()
+            if lines is None:
+                reload()  # Rotated or truncated: start again at the end of the new file
+            elif lines:
+                log_text.config(state=tk.NORMAL)
+                log_text.insert("end-1c", "".join(text + "\n" for _, text in lines))
+                view["offsets"].extend(offset for offset, _ in lines)
+                trim(from_top=True)
+                log_text.config(state=tk.DISABLED)
+                log_text.see(tk.END)
+                show_status()
+        log_window.after(LOG_POLL_MS, load_newer)
+
+    def reload(event=None):
+        view["reader"] = LogReader(LOG_PATH, filter_entry.get().strip())
+        view["offsets"].clear()
+        log_text.config(state=tk.NORMAL)
+        log_text.delete("1.0", tk.END)
+        log_text.config(state=tk.DISABLED)
+        load_older()
+        log_text.see(tk.END)
+
+    def on_scroll(first, last):
+        scrollbar.set(first, last)
+        if float(first) <= 0 and view["reader"] and view["reader"].top > 0:
+            log_window.after_idle(load_older)
+
+    log_text.config(yscrollcommand=on_scroll)
+    scrollbar.config(command=log_text.yview)
+    filter_entry.bind("<Return>", reload)
+    tk.Button(controls, text="Apply", command=reload).pack(side="left")
+    tk.Button(controls, text="Load Older", command=load_older).pack(side="left", padx=5)
+
+    reload()
+    log_window.after(LOG_POLL_MS, load_newer)
+
+# Per-attempt metrics and totals, refreshed while the window is open
+def open_statistics():
+    stats_window = tk.Toplevel(root)
+    stats_window.title("Statistics")
+    stats_window.geometry("900x360")
+
+    totals_label = tk.Label(stats_window, justify="left", anchor="w", font=("Courier", 9))
+    totals_label.pack(fill="x", padx=5, pady=5)
+
+    columns = ("file", "attempt", "outcome", "ttfb", "connect", "mb", "mbps", "retries", "stalls", "write")
+    headings = ("File", "Try", "Outcome", "TTFB s", "Connect p50", "MB", "MB/s", "Retries", "Stalls", "Write p95")
+    tree = ttk.Treeview(stats_window, columns=columns, show="headings")
+    for column, heading in zip(columns, headings):
+        tree.heading(column, text=heading)
+        tree.column(column, width=220 if column == "file" else 70, anchor="w" if column == "file" else "e")
+    tree.pack(fill="both", expand=True, padx=5, pady=5)
+
+    def seconds(value):
+        return "-" if value is None else f"{value:g}"
+
+    def refresh():
+        if not stats_window.winfo_exists():
+            return
+        totals = metrics_registry.totals()
+        totals_label.config(text=(
+            f"{totals['attempts']} attempts, {totals['bytes'] / 1024 / 1024:.1f} MB, {totals['requests']} requests, "
+            f"{totals['retries']} retries, {totals['stalls']} stalls | request TTFB p50 "
+            f"{seconds(totals['request_ttfb'].quantile(0.5))} s, connect p50 {seconds(totals['connect'].quantile(0.5))} s, "
+            f"throughput p50 {seconds(totals['throughput'].quantile(0.5))} MB/s, "
+            f"disk write p95 {seconds(totals['write_latency'].quantile(0.95))} s"))
+        attempts = metrics_registry.attempts()
+        for metrics in set(rows) - set(attempts):
+            tree.delete(rows.pop(metrics))  # Fell out of the recent attempts
+        for index, metrics in enumerate(attempts):
+            if metrics in rows and metrics in done:
+                continue  # Finished and already shown: its numbers won't change
+            row = metrics.to_dict()
+            values = (row["file"], row["attempt"], row["outcome"] or "running", seconds(row["ttfb"]),
+                      seconds(metrics.connect.quantile(0.5)), f"{row['bytes'] / 1024 / 1024:.1f}",
+                      row["mb_per_s"], row["retries"], row["stalls"], seconds(metrics.write_latency.quantile(0.95)))
+            if metrics in rows:
+                tree.item(rows[metrics], values=values)
+            else:
+                rows[metrics] = tree.insert("", index, values=values)
+            if metrics.outcome:
+                done.add(metrics)
+        done.intersection_update(rows)
+        stats_window.after(1000, refresh)
 
-    with open('download_manager.log', 'r') as log_file:
-        log_data = log_file.read()
+    rows = {}  # TaskMetrics -> tree row
+    done = set()  # Rows drawn after their attempt finished
 
-    log_text = tk.Text(log_window, wrap="word")
-    log_text.insert(tk.END, log_data)
-    log_text.config(state=tk.DISABLED)  # Make the log read-only
-    log_text.pack(fill="both", expand=True)
+    refresh()
 
 # Settings menu
 def open_settings():
     settings_window = tk.Toplevel(root)
     settings_window.title("Settings")
-    settings_window.geometry("300x200")
+    settings_window.geometry("300x320")
 
     close_checkbox = tk.Checkbutton(
         settings_window,
@@ -402,52 +3080,104 @@ def open_settings():
         try:
             speed_limit = int(speed_limit_entry.get())
             if speed_limit >= 0:
-                global DEFAULT_SPEED_LIMIT
-                DEFAULT_SPEED_LIMIT = speed_limit
-                logging.info(f"Speed limit set to {speed_limit} MB/s")
+                set_global_speed_limit(speed_limit)  # Applies to running downloads too
             else:
                 raise ValueError
         except ValueError:
             messagebox.showerror("Error", "Please enter a valid positive integer for the speed limit.")
-    
+
     tk.Button(settings_window, text="Set Speed Limit", command=set_speed_limit).pack(pady=10)
 
-# Create the main window
-root = tk.Tk()
-root.title("SlowDownloadManager")
-root.geometry("1000x600")  # Increased height to fit all elements properly
-
-# Initialize the BooleanVar after root window is created
-close_on_complete = tk.BooleanVar(value=False)  # Option to close on download completion
-
-# Add menu bar for settings
-menu_bar = tk.Menu(root)
-settings_menu = tk.Menu(menu_bar, tearoff=0)
-settings_menu.add_command(label="Settings", command=open_settings)
-settings_menu.add_command(label="View Logs", command=view_logs)
-menu_bar.add_cascade(label="Options", menu=settings_menu)
-root.config(menu=menu_bar)
-
-# Pause and Resume All buttons
-pause_all_button = tk.Button(root, text="Pause All", command=pause_all_downloads)
-pause_all_button.grid(row=0, column=1, padx=10, pady=10, sticky="w")
-
-resume_all_button = tk.Button(root, text="Resume All", command=resume_all_downloads)
-resume_all_button.grid(row=0, column=2, padx=10, pady=10, sticky="w")
-
-# Remove the "Ready" text (status bar removed completely)
-
-# Download tasks and their respective progress indicators
-task_list = []
-progress_bars = []
-progress_labels = []
-status_labels = []
-speed_labels = []
-time_left_labels = []
-
-# Add "+" button for opening the add download window
-add_download_button = tk.Button(root, text="+", font=("Arial", 14), command=open_add_download_window)
-add_download_button.grid(row=0, column=0, padx=10, pady=10, sticky="w")
-
-# Run the application
-root.mainloop()
+    # Number of downloads that run at once; the rest wait in the queue
+    tk.Label(settings_window, text="Max active downloads").pack(pady=5)
+    max_active_entry = tk.Entry(settings_window)
+    max_active_entry.insert(0, str(engine.queue.max_active))
+    max_active_entry.pack(pady=5)
+
+    def set_max_active():
+        try:
+            max_active = int(max_active_entry.get())
+            if max_active < 1:
+                raise ValueError
+            engine.queue.set_max_active(max_active)
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a whole number of at least 1.")
+
+    tk.Button(settings_window, text="Set Max Active", command=set_max_active).pack(pady=10)
+
+def run_gui(profile_startup=False):
+    """Create the main window and run the Tk event loop."""
+    global root, close_on_complete, task_view
+    if tk is None:
+        raise SystemExit("tkinter is not available; use 'python -m sdm fetch URL...' instead.")
+
+    # Create the main window
+    root = tk.Tk()
+    root.title("SlowDownloadManager")
+    root.geometry("1000x600")  # Increased height to fit all elements properly
+
+    # Initialize the BooleanVar after root window is created
+    close_on_complete = tk.BooleanVar(value=False)  # Option to close on download completion
+
+    engine.add_listener(on_task_event)
+
+    # Add menu bar for settings
+    menu_bar = tk.Menu(root)
+    settings_menu = tk.Menu(menu_bar, tearoff=0)
+    settings_menu.add_command(label="Settings", command=open_settings)
+    settings_menu.add_command(label="View Logs", command=view_logs)
+    settings_menu.add_command(label="Statistics", command=open_statistics)
+    settings_menu.add_separator()
+    settings_menu.add_command(label="Import URLs from File...", command=lambda: import_urls("file"))
+    settings_menu.add_command(label="Import URLs from Clipboard", command=lambda: import_urls("clipboard"))
+    menu_bar.add_cascade(label="Options", menu=settings_menu)
+    root.config(menu=menu_bar)
+
+    # Pause and Resume All buttons
+    pause_all_button = tk.Button(root, text="Pause All", command=pause_all_downloads)
+    pause_all_button.grid(row=0, column=1, padx=10, pady=10, sticky="w")
+
+    resume_all_button = tk.Button(root, text="Resume All", command=resume_all_downloads)
+    resume_all_button.grid(row=0, column=2, padx=10, pady=10, sticky="w")
+
+    # Add "+" button for opening the add download window
+    add_download_button = tk.Button(root, text="+", font=("Arial", 14), command=open_add_download_window)
+    add_download_button.grid(row=0, column=0, padx=10, pady=10, sticky="w")
+
+    # Buttons for the selected rows
+    for column, (text, command) in enumerate((("Pause", pause_selected), ("Resume", resume_selected),
+                                              ("Cancel", cancel_selected), ("Move to Front", move_selected_to_front)),
+                                             start=3):
+        tk.Button(root, text=text, command=command).grid(row=0, column=column, padx=5, pady=10, sticky="w")
+
+    # Task list: a Treeview draws only the visible rows, so thousands of tasks stay cheap
+    list_frame = tk.Frame(root)
+    list_frame.grid(row=1, column=0, columnspan=8, padx=5, pady=5, sticky="nsew")
+    root.grid_rowconfigure(1, weight=1)
+    root.grid_columnconfigure(7, weight=1)
+    task_view = ttk.Treeview(list_frame, columns=[name for name, _, _ in TASK_COLUMNS], show="headings")
+    for name, heading, width in TASK_COLUMNS:
+        task_view.heading(name, text=heading)
+        task_view.column(name, width=width, anchor="w" if name == "file" else "e", stretch=name == "file")
+    task_scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=task_view.yview)
+    task_view.configure(yscrollcommand=task_scrollbar.set)
+    task_scrollbar.pack(side="right", fill="y")
+    task_view.pack(side="left", fill="both", expand=True)
+
+    restore_tasks()
+    root.after(PROGRESS_INTERVAL_MS, gui_tick)
+
+    if profile_startup:
+        root.update()  # Map and draw the first window
+        report_startup("first window")
+        root.destroy()
+        return
+
+    # Run the application
+    root.mainloop()
+
+
+IMPORT_FINISHED = perf_counter()
+
+if __name__ == "__main__":
+    sys.exit(main())
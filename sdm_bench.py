@@ -0,0 +1,624 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import hashlib
+import tempfile
+import statistics
+import threading
+import subprocess
+import http.server
+from email.utils import formatdate
+import itertools
+from itertools import product
+
+try:
+    import resource  # CPU time and peak RSS (not available on Windows)
+except ImportError:
+    resource = None
+
+# Benchmark harness for sdm.py's download engine and sdmlauncher.py's startup.
+#
+#   python sdm_bench.py run --output results.json
+#   python sdm_bench.py run --sizes 1K,64M,1G --threads 1,8 --chunks 64K,1M --latency 20
+#   python sdm_bench.py run --compare baseline.json   (exit code 1 on a regression)
+#   python sdm_bench.py serve --port 8000 --bandwidth 2M
+#   python sdm_bench.py startup --latency 80   (launcher against a local stand-in for GitHub)
+#   python sdm_bench.py check   (behaviour checks, e.g. one slow connection; exit code 1 on a failure)
+#
+# "run" starts a local Range-capable HTTP server in its own process, then
+# downloads every (size, threads, chunk) combination in a fresh child process
+# so CPU time and peak RSS belong to that single run. File contents are
+# generated from the offset, so even 4 GB files need no disk on the server.
+
+DEFAULT_SIZES = "1K,1M,16M,64M"
+DEFAULT_THREADS = "1,4,8"
+DEFAULT_CHUNKS = "64K,1M"
+PATTERN_PERIOD = 251  # Prime, so ranges never line up with power-of-two chunks
+SERVE_PIECE = 256 * 1024  # Bytes the server writes per send
+PATTERN = bytes(i % PATTERN_PERIOD for i in range(SERVE_PIECE + PATTERN_PERIOD))
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+# Parse "64K", "1M", "4G" into bytes
+def parse_size(text):
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([KMG]?)B?", text.strip().upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"Not a size: {text}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def parse_list(text, convert):
+    return [convert(item) for item in text.split(",") if item.strip()]
+
+
+# Bytes [start, end) of the generated file
+def pattern_bytes(start, end):
+    while start < end:
+        offset = start % PATTERN_PERIOD
+        length = min(SERVE_PIECE, end - start)
+        yield PATTERN[offset:offset + length]
+        start += length
+
+
+###############################################################################
+# Local HTTP server with Range support and injected latency/bandwidth/failures
+###############################################################################
+
+class BenchHandler(http.server.BaseHTTPRequestHandler):
+    """Serves /bytes/<size> with Range support; behaviour comes from server.options."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Otherwise small responses wait for delayed ACKs
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+    def file_size(self):
+        match = re.fullmatch(r"/bytes/(\d+)(/.*)?", self.path)
+        return int(match.group(1)) if match else None
+
+    def send_head(self):
+        options = self.server.options
+        if options.latency:
+            time.sleep(options.latency / 1000)
+        size = self.file_size()
+        if size is None:
+            self.send_error(404)
+            return None
+
+        if self.command == "GET" and options.fail_rate and self.server.random.random() < options.fail_rate:
+            self.send_response(503)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+
+        start, end = 0, size
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match and options.ranges:
+            start = int(match.group(1))
+            end = min(size, int(match.group(2)) + 1) if match.group(2) else size
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start))
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("ETag", f'"bench-{size}"')
+        if options.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        return start, end
+
+    def do_HEAD(self):
+        self.send_head()
+
+    def do_GET(self):
+        body_range = self.send_head()
+        if body_range is None:
+            return
+        start, end = body_range
+        options = self.server.options
+        # Drop the connection half way through the body now and then
+        cut_at = end
+        if options.drop_rate and self.server.random.random() < options.drop_rate:
+            cut_at = start + (end - start) // 2
+        bandwidth = options.slow_bandwidth if next(self.server.gets) in options.slow_requests else options.bandwidth
+        sent_since = time.monotonic()
+        sent = 0
+        try:
+            for piece in pattern_bytes(start, cut_at):
+                self.wfile.write(piece)
+                sent += len(piece)
+                if bandwidth:
+                    ahead = sent / bandwidth - (time.monotonic() - sent_since)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        if cut_at < end:
+            self.close_connection = True
+
+
+class BenchServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)  # Clients closing keep-alive sockets is normal
+
+
+def serve(options):
+    server = BenchServer((options.host, options.port), BenchHandler)
+    server.options = options
+    server.random = random.Random(options.seed)
+    server.gets = itertools.count(1)  # Numbers the GETs that get a body, for --slow-requests
+    print(json.dumps({"port": server.server_address[1]}), flush=True)
+    server.serve_forever()
+
+
+def start_server_process(args):
+    """Run the server in a child process so its CPU time isn't counted."""
+    command = [sys.executable, os.path.abspath(__file__), "serve", "--port", "0",
+               "--latency", str(args.latency), "--bandwidth", str(args.bandwidth),
+               "--fail-rate", str(args.fail_rate), "--drop-rate", str(args.drop_rate),
+               "--seed", str(args.seed), "--slow-bandwidth", str(args.slow_bandwidth)]
+    if args.slow_requests:
+        command += ["--slow-requests", ",".join(map(str, args.slow_requests))]
+    if args.no_ranges:
+        command.append("--no-ranges")
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    port = json.loads(process.stdout.readline())["port"]
+    return process, f"http://127.0.0.1:{port}"
+
+
+###############################################################################
+# One measured download (runs in its own process)
+###############################################################################
+
+def cpu_seconds():
+    if resource is None:
+        return time.process_time()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes on macOS, KB elsewhere
+
+
+def verify(path, size):
+    """Check the size and a handful of sampled offsets against the pattern."""
+    if os.path.getsize(path) != size:
+        return False
+    offsets = {0, size - 1, size // 2} | {random.randrange(size) for _ in range(16)} if size else set()
+    with open(path, "rb") as output:
+        for offset in offsets:
+            output.seek(offset)
+            if output.read(1) != bytes([offset % PATTERN_PERIOD]):
+                return False
+    return True
+
+
+def run_one(args):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import sdm
+
+    sdm.CHUNK_SIZE = args.chunk
+    sdm.DEFAULT_RETRY_INTERVAL = args.retry_interval
+    # sdm imports these on first use; load them now so the import isn't timed as download work
+    for module, attribute in ((sdm.requests, "Session"), (sdm.concurrent_futures, "ThreadPoolExecutor"),
+                              (sdm.http_client, "IncompleteRead"), (sdm.email_utils, "parsedate_to_datetime")):
+        getattr(module, attribute)
+    url = f"{args.base_url}/bytes/{args.size}/bench.bin"
+
+    with tempfile.TemporaryDirectory(prefix="sdm-bench-") as folder:
+        task = sdm.DownloadTask(url, folder, retries=args.retries, num_threads=args.threads,
+                                autotune=args.autotune, pool=sdm.SessionPool())
+        marks = {}
+
+        # Poll progress to find the first byte and the start of the last 10%
+        def watch():
+            tail_at = args.size * 0.9
+            while not task.finished.is_set():
+                downloaded = task.downloaded_size
+                now = time.perf_counter()
+                if downloaded and "first_byte" not in marks:
+                    marks["first_byte"] = now
+                if downloaded >= tail_at and "tail" not in marks:
+                    marks["tail"] = now
+                    return
+                time.sleep(0.001)
+
+        watcher = threading.Thread(target=watch, daemon=True)
+        cpu_before = cpu_seconds()
+        started = time.perf_counter()
+        watcher.start()
+        task.start()
+        task.finished.wait()  # Retries run on timers; wait for the final outcome
+        finished = time.perf_counter()
+        cpu_used = cpu_seconds() - cpu_before
+
+        elapsed = finished - started
+        gigabytes = args.size / 1024 ** 3
+        result = {
+            "size": args.size,
+            "threads": args.threads,
+            "chunk": args.chunk,
+            "autotune": args.autotune,
+            "ok": task.is_completed and verify(task.file_path, args.size),
+            "seconds": round(elapsed, 4),
+            "mb_per_s": round(args.size / 1024 ** 2 / elapsed, 2) if elapsed else None,
+            "cpu_seconds": round(cpu_used, 4),
+            "cpu_seconds_per_gb": round(cpu_used / gigabytes, 3) if gigabytes else None,
+            "peak_rss_mb": peak_rss_mb(),
+            # Runs shorter than the poll interval count their first byte at the end
+            "ttfb_seconds": round(marks.get("first_byte", finished) - started, 4),
+            "tail_seconds": round(finished - marks.get("tail", finished), 4),
+            "retries": task.retry_count,
+        }
+    print(json.dumps(result))
+    return 0 if result["ok"] else 1
+
+
+###############################################################################
+# Launcher startup: sdmlauncher.py against a local stand-in for GitHub
+###############################################################################
+
+class ScriptHandler(http.server.BaseHTTPRequestHandler):
+    """Serves server.script with ETag/Last-Modified and answers revalidation with 304."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency / 1000)
+        body, etag, modified = self.server.script
+        if self.headers.get("If-None-Match") == etag or self.headers.get("If-Modified-Since") == modified:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def time_launch(launcher, script_url, workdir, flags, script_args, timeout):
+    """Wall time of one launcher process, or None if it failed."""
+    env = dict(os.environ, SDM_SCRIPT_URL=script_url)
+    started = time.perf_counter()
+    child = subprocess.run([sys.executable, launcher] + flags + script_args, cwd=workdir, env=env,
+                           capture_output=True, timeout=timeout)
+    elapsed = time.perf_counter() - started
+    return elapsed if child.returncode == 0 else None
+
+
+def run_startup(args):
+    """Time the old download-and-spawn launch against cold, warm and offline cached launches."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    launcher = os.path.join(here, "sdmlauncher.py")
+    with open(os.path.join(here, "sdm.py"), "rb") as f:
+        body = f.read()
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ScriptHandler)
+    server.daemon_threads = True
+    server.latency = args.latency
+    server.script = (body, f'"{hashlib.sha1(body).hexdigest()}"', formatdate(usegmt=True))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    script_url = f"http://127.0.0.1:{server.server_address[1]}/sdm.py"
+    offline_url = "http://127.0.0.1:9/sdm.py"  # Discard port: connection refused
+    script_args = args.script_args.split()
+
+    # (name, flags, url, start from an empty cache)
+    modes = [
+        ("download-and-spawn", ["--no-cache"], script_url, True),
+        ("cached-cold", [], script_url, True),
+        ("cached-warm", [], script_url, False),
+        ("cached-offline", [], offline_url, False),
+    ]
+    results = []
+    try:
+        for name, flags, url, cold in modes:
+            times = []
+            with tempfile.TemporaryDirectory(prefix="sdm-bench-launch-") as workdir:
+                if not cold:
+                    time_launch(launcher, script_url, workdir, [], script_args, args.timeout)  # Fill the cache
+                for repeat in range(args.repeat):
+                    if cold:
+                        for name_in_dir in os.listdir(workdir):
+                            os.remove(os.path.join(workdir, name_in_dir))
+                    times.append(time_launch(launcher, url, workdir, flags, script_args, args.timeout))
+            ok = all(t is not None for t in times)
+            result = {"mode": name, "ok": ok,
+                      "median_seconds": round(statistics.median(times), 4) if ok else None,
+                      "min_seconds": round(min(times), 4) if ok else None}
+            results.append(result)
+            print(f"{name}: {result['median_seconds']} s median, ok={ok}", file=sys.stderr)
+    finally:
+        server.shutdown()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "latency_ms": args.latency,
+        "script_args": script_args,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text)
+    else:
+        print(text)
+    return 0 if all(result["ok"] for result in results) else 1
+
+
+###############################################################################
+# Behaviour checks: scenarios that must end in time or in a given state
+###############################################################################
+
+def check_slow_connection(sdm, folder):
+    """One throttled connection must not hold the download up while the others sit idle."""
+    size = 32 * 1024 ** 2
+    seconds = {}
+    for name, slow_requests in (("clean", []), ("slow", [2])):  # GET 1 is the first range, 2 the next segment
+        server, base_url = start_server_process(server_options(bandwidth=8 * 1024 ** 2, slow_requests=slow_requests))
+        try:
+            task = sdm.DownloadTask(f"{base_url}/bytes/{size}/{name}.bin", folder, num_threads=8,
+                                    autotune=False, pool=sdm.SessionPool())
+            started = time.perf_counter()
+            task.start()
+            seconds[name] = time.perf_counter() - started
+            if not (task.is_completed and verify(task.file_path, size)):
+                return False, f"{name} download failed: {task.status}"
+        finally:
+            server.terminate()
+            server.wait()
+    limit = 2 * seconds["clean"] + 2 * sdm.ENDGAME_SECONDS
+    return seconds["slow"] <= limit, (f"{seconds['slow']:.2f}s with one slow connection, "
+                                      f"{seconds['clean']:.2f}s without (limit {limit:.2f}s)")
+
+
+def check_scheduled_resume(sdm, folder):
+    """A task paused while it waits for its scheduled time must not start early once resumed."""
+    from datetime import datetime, timedelta
+    server, base_url = start_server_process(server_options())
+    try:
+        engine = sdm.DownloadEngine(pool=sdm.SessionPool())
+        started = []
+
+        def on_event(task, event, status=None, **details):
+            if status == "Downloading":
+                started.append(time.time())
+
+        engine.add_listener(on_event)
+        start_at = datetime.now() + timedelta(seconds=2)
+        task = engine.add(f"{base_url}/bytes/1024/scheduled.bin", folder, schedule_time=start_at)
+        task.pause()
+        task.resume()
+        status = task.status
+        if not task.finished.wait(10):
+            return False, f"never finished, last status {task.status}"
+    finally:
+        server.terminate()
+        server.wait()
+    if not started:
+        return False, f"never started, status after resume {status}"
+    offset = started[0] - start_at.timestamp()
+    return (status == "Scheduled" and task.is_completed and offset >= 0,
+            f"status after resume {status}, started {offset:+.2f}s from its scheduled time")
+
+
+CHECKS = (check_slow_connection, check_scheduled_resume)
+
+
+def run_checks(args):
+    failures = 0
+    with tempfile.TemporaryDirectory(prefix="sdm-bench-check-") as workdir:
+        os.chdir(workdir)  # Before importing sdm, so its log and host profiles land here
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import sdm
+
+        for check in CHECKS:
+            name = check.__name__[len("check_"):]
+            if args.only and name not in args.only:
+                continue
+            with tempfile.TemporaryDirectory(prefix="sdm-bench-check-", dir=workdir) as folder:
+                ok, detail = check(sdm, folder)
+            failures += not ok
+            print(f"{'PASS' if ok else 'FAIL'} {name}: {detail}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+###############################################################################
+# Matrix runner and regression check
+###############################################################################
+
+def run_matrix(args):
+    server, base_url = start_server_process(args)
+    results = []
+    try:
+        for size, threads, chunk in product(args.sizes, args.threads, args.chunks):
+            for repeat in range(args.repeat):
+                command = [sys.executable, os.path.abspath(__file__), "one", "--base-url", base_url,
+                           "--size", str(size), "--threads", str(threads), "--chunk", str(chunk),
+                           "--retries", str(args.retries), "--retry-interval", str(args.retry_interval)]
+                if args.autotune:
+                    command.append("--autotune")
+                # A fresh working directory keeps logs and learned host profiles out of the way
+                with tempfile.TemporaryDirectory(prefix="sdm-bench-cwd-") as workdir:
+                    child = subprocess.run(command, capture_output=True, text=True, timeout=args.timeout, cwd=workdir)
+                try:
+                    result = json.loads(child.stdout.strip().splitlines()[-1])
+                except (IndexError, ValueError):
+                    result = {"size": size, "threads": threads, "chunk": chunk, "ok": False,
+                              "error": child.stderr.strip()[-500:]}
+                result["repeat"] = repeat
+                results.append(result)
+                print(f"size={size} threads={threads} chunk={chunk}: "
+                      f"{result.get('mb_per_s')} MB/s, {result.get('cpu_seconds_per_gb')} CPU s/GB, "
+                      f"ok={result['ok']}", file=sys.stderr)
+    finally:
+        server.terminate()
+        server.wait()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "server": {"latency_ms": args.latency, "bandwidth": args.bandwidth, "fail_rate": args.fail_rate,
+                   "drop_rate": args.drop_rate, "ranges": not args.no_ranges, "seed": args.seed},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text)
+    else:
+        print(text)
+
+    status = 0 if all(result["ok"] for result in results) else 1
+    if args.compare:
+        status = max(status, compare(report, args.compare, args.tolerance))
+    return status
+
+
+def compare(report, baseline_path, tolerance):
+    """Return 1 if any run is more than tolerance slower or costlier than the baseline."""
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    def key(result):
+        return result["size"], result["threads"], result["chunk"], result.get("autotune", False)
+
+    def best(results):
+        merged = {}
+        for result in results:
+            if result.get("ok") and result.get("mb_per_s"):
+                current = merged.get(key(result))
+                if current is None or result["mb_per_s"] > current["mb_per_s"]:
+                    merged[key(result)] = result
+        return merged
+
+    old, new = best(baseline["results"]), best(report["results"])
+    regressions = 0
+    for run_key, result in new.items():
+        before = old.get(run_key)
+        if before is None:
+            continue
+        if result["mb_per_s"] < before["mb_per_s"] * (1 - tolerance):
+            print(f"REGRESSION {run_key}: {before['mb_per_s']} -> {result['mb_per_s']} MB/s", file=sys.stderr)
+            regressions += 1
+        cpu_before, cpu_after = before.get("cpu_seconds_per_gb"), result.get("cpu_seconds_per_gb")
+        if cpu_before and cpu_after and cpu_after > cpu_before * (1 + tolerance):
+            print(f"REGRESSION {run_key}: {cpu_before} -> {cpu_after} CPU s/GB", file=sys.stderr)
+            regressions += 1
+    return 1 if regressions else 0
+
+
+def add_server_options(parser):
+    parser.add_argument("--latency", type=float, default=0, help="Milliseconds added before every response")
+    parser.add_argument("--bandwidth", type=parse_size, default=0, help="Bytes/s per connection, e.g. 5M (0 = unlimited)")
+    parser.add_argument("--fail-rate", type=float, default=0, help="Share of GETs answered with 503")
+    parser.add_argument("--drop-rate", type=float, default=0, help="Share of GETs cut off half way")
+    parser.add_argument("--no-ranges", action="store_true", help="Ignore Range headers like a basic server")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for failure injection")
+    parser.add_argument("--slow-requests", type=lambda text: parse_list(text, int), default=[],
+                        help="GETs served at --slow-bandwidth, counted from 1, e.g. 2,5")
+    parser.add_argument("--slow-bandwidth", type=parse_size, default=64 * 1024,
+                        help="Bytes/s for those GETs (default 64K)")
+
+
+def server_options(**changes):
+    """The server's default options with a few changed, for starting one from code."""
+    parser = argparse.ArgumentParser()
+    add_server_options(parser)
+    options = parser.parse_args([])
+    vars(options).update(changes)
+    return options
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="sdm_bench", description="Throughput benchmarks for sdm.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmark matrix")
+    run_parser.add_argument("--sizes", type=lambda text: parse_list(text, parse_size), default=DEFAULT_SIZES,
+                            help=f"File sizes (default {DEFAULT_SIZES}; up to 4G)")
+    run_parser.add_argument("--threads", type=lambda text: parse_list(text, int), default=DEFAULT_THREADS,
+                            help=f"Connection counts (default {DEFAULT_THREADS})")
+    run_parser.add_argument("--chunks", type=lambda text: parse_list(text, parse_size), default=DEFAULT_CHUNKS,
+                            help=f"CHUNK_SIZE values (default {DEFAULT_CHUNKS})")
+    run_parser.add_argument("--autotune", action="store_true", help="Let the engine tune connections per host")
+    run_parser.add_argument("--repeat", type=int, default=1, help="Runs per combination")
+    run_parser.add_argument("--retries", type=int, default=3)
+    run_parser.add_argument("--retry-interval", type=float, default=1, help="Seconds between task retries")
+    run_parser.add_argument("--timeout", type=float, default=3600, help="Seconds before a run is killed")
+    run_parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    run_parser.add_argument("--compare", help="Baseline JSON report to check for regressions")
+    run_parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown (default 0.10)")
+    add_server_options(run_parser)
+
+    serve_parser = commands.add_parser("serve", help="Only run the test server")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    add_server_options(serve_parser)
+
+    startup_parser = commands.add_parser("startup", help="Time sdmlauncher.py launches")
+    startup_parser.add_argument("--latency", type=float, default=50, help="Milliseconds the stand-in adds per request")
+    startup_parser.add_argument("--repeat", type=int, default=5, help="Launches per mode")
+    startup_parser.add_argument("--script-args", default="fetch --help",
+                                help="Arguments passed to sdm.py (default: 'fetch --help', which exits at once)")
+    startup_parser.add_argument("--timeout", type=float, default=60, help="Seconds before a launch is killed")
+    startup_parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+
+    check_parser = commands.add_parser("check", help="Run the behaviour checks")
+    check_parser.add_argument("--only", type=lambda text: parse_list(text, str), default=[],
+                              help="Comma-separated check names, e.g. slow_connection")
+
+    one_parser = commands.add_parser("one", help=argparse.SUPPRESS)
+    one_parser.add_argument("--base-url", required=True)
+    one_parser.add_argument("--size", type=int, required=True)
+    one_parser.add_argument("--threads", type=int, required=True)
+    one_parser.add_argument("--chunk", type=int, required=True)
+    one_parser.add_argument("--autotune", action="store_true")
+    one_parser.add_argument("--retries", type=int, default=3)
+    one_parser.add_argument("--retry-interval", type=float, default=1)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        args.ranges = not args.no_ranges
+        serve(args)
+        return 0
+    if args.command == "one":
+        return run_one(args)
+    if args.command == "startup":
+        return run_startup(args)
+    if args.command == "check":
+        return run_checks(args)
+    if isinstance(args.sizes, str):
+        args.sizes = parse_list(args.sizes, parse_size)
+    if isinstance(args.threads, str):
+        args.threads = parse_list(args.threads, int)
+    if isinstance(args.chunks, str):
+        args.chunks = parse_list(args.chunks, parse_size)
+    return run_matrix(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
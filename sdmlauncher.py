@@ -1,23 +1,112 @@
 import os
-import subprocess
 import sys
+import json
+import runpy
+import py_compile
+import subprocess
+import urllib.error
 import urllib.request
 
-# URL of your script on GitHub
-SCRIPT_URL = "https://raw.githubusercontent.com/Electro0000/KindaBadLauncher/refs/heads/main/sdm.py"
+# URL of your script on GitHub (SDM_SCRIPT_URL overrides it, e.g. for a local mirror)
+SCRIPT_URL = os.environ.get(
+    "SDM_SCRIPT_URL", "https://raw.githubusercontent.com/Electro0000/KindaBadLauncher/refs/heads/main/sdm.py")
 SCRIPT_PATH = "sdm.py"
+META_PATH = SCRIPT_PATH + ".meta.json"  # ETag and Last-Modified of the cached copy
+BYTECODE_PATH = SCRIPT_PATH + "c"  # Compiled once per version instead of on every launch
+CHECK_TIMEOUT = 2  # Seconds to wait for GitHub before using the cached copy
+
+# Usage: python sdmlauncher.py [--no-cache] [--subprocess] [sdm.py arguments...]
+#   --no-cache    always download the script again (the old behaviour)
+#   --subprocess  run the script in a new interpreter instead of in this one
+LAUNCHER_FLAGS = ("--no-cache", "--subprocess")
+
+
+def load_meta():
+    """Validators saved with the cached copy, if any."""
+    try:
+        with open(META_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def compile_script():
+    """Write bytecode next to the script; False if it doesn't compile."""
+    try:
+        py_compile.compile(SCRIPT_PATH, cfile=BYTECODE_PATH, doraise=True)
+        return True
+    except py_compile.PyCompileError as e:
+        print(f"Could not compile {SCRIPT_PATH}: {e}")
+        return False
+
 
-def download_script():
-    """Download the latest version of the script from GitHub."""
-    print("Downloading script from GitHub...")
-    urllib.request.urlretrieve(SCRIPT_URL, SCRIPT_PATH)
+def download_script(use_cache=True):
+    """Fetch the script if GitHub has a newer version; True if the copy on disk changed."""
+    meta = load_meta() if use_cache and os.path.exists(SCRIPT_PATH) else {}
+    request = urllib.request.Request(SCRIPT_URL)
+    if meta.get("etag"):
+        request.add_header("If-None-Match", meta["etag"])
+    if meta.get("last_modified"):
+        request.add_header("If-Modified-Since", meta["last_modified"])
+
+    try:
+        with urllib.request.urlopen(request, timeout=CHECK_TIMEOUT) as response:
+            body = response.read()
+            meta = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return False  # Cached copy is current
+        if not os.path.exists(SCRIPT_PATH):
+            raise
+        print(f"GitHub answered {e.code}, using the cached script")
+        return False
+    except (urllib.error.URLError, OSError) as e:
+        if not os.path.exists(SCRIPT_PATH):
+            raise
+        print(f"Offline ({e}), using the cached script")
+        return False
+
+    # Replace the script in one step so a cut-off download never leaves half a file
+    partial_path = SCRIPT_PATH + ".part"
+    with open(partial_path, "wb") as f:
+        f.write(body)
+    # Old bytecode goes first: runpy never checks a .pyc against its source, and on
+    # filesystems with coarse timestamps the new script may not look any newer
+    if os.path.exists(BYTECODE_PATH):
+        os.remove(BYTECODE_PATH)
+    os.replace(partial_path, SCRIPT_PATH)
+    with open(META_PATH, "w") as f:
+        json.dump(meta, f)
     print(f"Downloaded script to {SCRIPT_PATH}")
+    return True
+
+
+def run_script(args, in_process=True, changed=False):
+    """Run the downloaded script, in this interpreter when its bytecode is ready.
+
+    changed says the script was just replaced; the modification times are
+    only a fallback, e.g. for a sdm.py copied in by hand.
+    """
+    stale = (changed or not os.path.exists(BYTECODE_PATH) or
+             os.path.getmtime(BYTECODE_PATH) < os.path.getmtime(SCRIPT_PATH))
+    if in_process and (not stale or compile_script()):
+        sys.argv = [SCRIPT_PATH] + args
+        runpy.run_path(BYTECODE_PATH, run_name="__main__")
+        return 0
+    return subprocess.run([sys.executable, SCRIPT_PATH] + args).returncode
+
+
+def main(argv=None):
+    args = list(sys.argv[1:] if argv is None else argv)
+    flags = set()
+    while args and args[0] in LAUNCHER_FLAGS:
+        flags.add(args.pop(0))
+
+    use_cache = "--no-cache" not in flags
+    changed = download_script(use_cache)  # Download the latest version of the script, if there is one
+    # Run the downloaded script
+    return run_script(args, in_process=use_cache and "--subprocess" not in flags, changed=changed)
 
-def run_script():
-    """Run the downloaded script."""
-    print("Running script...")
-    subprocess.run([sys.executable, SCRIPT_PATH])
 
 if __name__ == "__main__":
-    download_script()  # Download the latest version of the script
-    run_script()  # Run the downloaded script
+    sys.exit(main())